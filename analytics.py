@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+
+# Kümülatif getiri dönemleri: anahtar -> dönem başlangıcını veren fonksiyon
+RETURN_PERIODS = {
+    '1w': lambda today: today - timedelta(days=7),
+    '1m': lambda today: today - timedelta(days=30),
+    '3m': lambda today: today - timedelta(days=91),
+    'ytd': lambda today: date(today.year, 1, 1),
+    '1y': lambda today: today - timedelta(days=365),
+}
+TRADING_DAYS = 252
+METRICS = [f'return_{p}' for p in RETURN_PERIODS] + ['volatility', 'max_drawdown', 'beta', 'tracking_error']
+
+
+def history_start(today):
+    """Tüm dönemler için gereken fiyat geçmişinin başlangıcı (dönem başındaki kapanış dahil)."""
+    return min(start(today) for start in RETURN_PERIODS.values()) - timedelta(days=10)
+
+
+def _base_index(dates, start):
+    """Dönem başlangıcında veya öncesindeki son kapanışın satırı (yoksa ilk satır)."""
+    return max(int(np.searchsorted(dates, np.datetime64(start), side='right')) - 1, 0)
+
+
+def portfolio_analytics(engine, closes, benchmark, today):
+    """
+    Tüm portföylerin dönemsel getiri ve risk ölçütlerini tek bir hizalı fiyat matrisi üzerinden hesaplar.
+
+    closes: indeksi tarih, sütunları sembol olan günlük kapanışlar (benchmark sütunu dahil)
+    Dönüş: {ölçüt: engine.names sırasıyla değer dizisi}. Getiri, volatilite, düşüş ve takip hatası
+    yüzde cinsindendir; volatilite ve takip hatası son 1 yılın günlük getirilerinden yıllıklandırılır.
+    """
+    n = len(engine.names)
+    nan = np.full(n, np.nan)
+    if closes.empty or len(closes) < 2:
+        return {metric: nan.copy() for metric in METRICS}
+
+    prices = closes.sort_index().ffill()
+    dates = prices.index.to_numpy(dtype='datetime64[ns]')
+    daily = prices.pct_change().iloc[1:]
+
+    # Portföylerin günlük getirileri (T-1 × portföy); verisi olmayan semboller 0 katkı yapar
+    portfolio_daily = engine.total_returns_series(daily.reindex(columns=engine.symbols).to_numpy() * 100) / 100
+    growth = np.vstack([np.ones(n), np.cumprod(1 + portfolio_daily, axis=0)])
+
+    result = {}
+    for period, start in RETURN_PERIODS.items():
+        base = growth[_base_index(dates, start(today))]
+        result[f'return_{period}'] = (growth[-1] / base - 1) * 100
+
+    # Risk ölçütleri son 1 yıl üzerinden
+    first = _base_index(dates, RETURN_PERIODS['1y'](today))
+    window = portfolio_daily[first:]
+    window_growth = growth[first:]
+    result['max_drawdown'] = (window_growth / np.maximum.accumulate(window_growth, axis=0) - 1).min(axis=0) * 100
+    if len(window) < 2:
+        for metric in ('volatility', 'beta', 'tracking_error'):
+            result[metric] = nan.copy()
+        return result
+    result['volatility'] = window.std(axis=0, ddof=1) * np.sqrt(TRADING_DAYS) * 100
+
+    if benchmark in daily.columns:
+        bench = np.nan_to_num(daily[benchmark].to_numpy(dtype=float))[first:]
+        bench_var = bench.var(ddof=1)
+        centered = window - window.mean(axis=0)
+        covariance = (centered * (bench - bench.mean())[:, None]).sum(axis=0) / (len(bench) - 1)
+        result['beta'] = covariance / bench_var if bench_var > 0 else nan.copy()
+        result['tracking_error'] = (window - bench[:, None]).std(axis=0, ddof=1) * np.sqrt(TRADING_DAYS) * 100
+    else:
+        result['beta'] = nan.copy()
+        result['tracking_error'] = nan.copy()
+    return result
+
+
+def analytics_table(engine, values):
+    """
+    portfolio_analytics çıktısını satır listesine ve her ölçüt için önceden sıralanmış
+    isim listelerine çevirir; böylece herhangi bir ölçüte göre sıralama bir sözlük erişimidir.
+    """
+    rows = []
+    for i, name in enumerate(engine.names):
+        row = {'name': name}
+        for metric in METRICS:
+            value = values[metric][i]
+            row[metric] = round(float(value), 4) if np.isfinite(value) else None
+        rows.append(row)
+
+    rankings = {}
+    for metric in METRICS:
+        ranked = sorted((r for r in rows if r[metric] is not None), key=lambda r: r[metric], reverse=True)
+        rankings[metric] = [r['name'] for r in ranked] + [r['name'] for r in rows if r[metric] is None]
+    return rows, rankings
+
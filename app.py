@@ -1,168 +1,194 @@
+import time
+_import_started = time.perf_counter()
+
 import os
 import json
-from flask import Flask, render_template, request, jsonify
-import yfinance as yf
-import requests
+import cProfile
+import random
+import threading
+import uuid
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 from datetime import date, timedelta, datetime
-import pandas as pd
-from supabase import create_client, Client
+import numpy as np
+
+# pandas, yfinance ve supabase açılışta yüklenmez: fiyat verisi (market_data) ve pandas
+# hesaplama fonksiyonlarının içinde, Supabase istemcisi ise ilk sorguda içe aktarılır.
+import metrics
+from cache import QuoteCache, shared_cache
+from analytics import METRICS as ANALYTICS_METRICS, history_start, portfolio_analytics, analytics_table
+from portfolio_engine import PortfolioReturnEngine
+from positions import PortfolioPositions, PositionsCache
+from lookthrough import LookthroughIndex
+from snapshot import SnapshotRefresher, DeltaFeed
+from watchlists import WatchlistRepository, DEFAULT_WATCHLIST
+from storage import (
+    PortfolioRepository, PortfolioConflictError, SupabaseBackend, JsonFileBackend, SqliteBackend,
+    portfolio_version, content_etag
+)
 
 app = Flask(__name__)
 
 # --- SUPABASE BAĞLANTISI ---
+# İstemci ilk kullanımda oluşturulur; böylece açılış ağ erişimi ve kimlik bilgisi gerektirmez.
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_supabase = None
+_supabase_lock = threading.Lock()
 
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                if not SUPABASE_URL:
+                    raise RuntimeError('SUPABASE_URL ve SUPABASE_KEY tanımlanmamış.')
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
 
-# --- VERİ YÜKLEME VE KAYDETME FONKSİYONLARI ---
-# (Bu bölümde değişiklik yok)
 
-def load_portfolios():
-    """Supabase veritabanından tüm portföyleri yükler."""
-    try:
-        response = supabase.table('portfolios').select('name, data').execute()
-        
-        portfolios_dict = {}
-        for row in response.data:
-            if row.get('data') and row['data'].get('current'):
-                portfolios_dict[row['name']] = row['data']
-            elif row.get('data') and 'stocks' in row['data']: 
-                print(f"Eski yapı tespit edildi: {row['name']}. 'current' içine taşınıyor...")
-                portfolios_dict[row['name']] = {'current': row['data'], 'history': []}
-            else:
-                print(f"Geçersiz veri yapısı atlanıyor: {row['name']}")
+# --- PORTFÖY DEPOSU ---
+# PORTFOLIO_BACKEND: 'supabase' (varsayılan), 'json' veya 'sqlite'.
+# Yerel arka uçlar internet bağlantısı olmadan test yapabilmek içindir.
 
-        return portfolios_dict
-    except Exception as e:
-        print(f"Supabase'den veri yüklenirken hata: {e}")
-        return {}
+def _create_portfolio_backend():
+    backend = os.environ.get('PORTFOLIO_BACKEND', 'supabase')
+    if backend == 'json':
+        return JsonFileBackend(os.environ.get('PORTFOLIO_JSON_PATH', 'portfolios.json'))
+    if backend == 'sqlite':
+        return SqliteBackend(os.environ.get('PORTFOLIO_SQLITE_PATH', 'portfolios.db'))
+    return SupabaseBackend(get_supabase)
 
-def save_portfolios(portfolios_dict):
-    """Tüm portföy sözlüğünü Supabase veritabanına kaydeder/günceller."""
-    try:
-        response = supabase.table('portfolios').select('name').execute()
-        db_names = {row['name'] for row in response.data}
-        local_names = set(portfolios_dict.keys())
-        names_to_delete = list(db_names - local_names)
+# Diğer worker'ların yazmaları en fazla PORTFOLIO_REVALIDATE_INTERVAL saniye içinde fark edilir
+portfolio_store = PortfolioRepository(
+    _create_portfolio_backend(), float(os.environ.get('PORTFOLIO_REVALIDATE_INTERVAL', 5))
+)
+# Kayıt başına saklanan geçmiş versiyon sayısı; geçmiş, güncel versiyona göre fark olarak sıkıştırılıp yazılır
+PORTFOLIO_HISTORY_LIMIT = int(os.environ.get('PORTFOLIO_HISTORY_LIMIT', 50))
+# Kayıtlı portföylerin pozisyonları (sembol, ağırlık, adet, tür) versiyon bazlı önbellekte tutulur
+portfolio_positions = PositionsCache(portfolio_version)
+portfolio_store.on_change(portfolio_positions.discard)
+# Varlık kodu -> (portföy, ağırlık) ters indeksi; kayıt/geri alma/silme sonrası sadece değişen portföy güncellenir
+fund_lookthrough = LookthroughIndex()
+portfolio_store.on_change(fund_lookthrough.mark_changed)
+# Kontrol paneli takip listeleri portföylerle aynı arka uçta tutulur
+# (diğer worker'ların kayıtları en fazla PORTFOLIO_REVALIDATE_INTERVAL saniye içinde görünür)
+watchlist_store = WatchlistRepository(portfolio_store.backend, portfolio_store.revalidate_interval)
 
-        if names_to_delete:
-            supabase.table('portfolios').delete().in_('name', names_to_delete).execute()
 
-        if portfolios_dict:
-            records_to_save = [{'name': name, 'data': data} for name, data in portfolios_dict.items()]
-            supabase.table('portfolios').upsert(records_to_save).execute()
-            
+# --- İSTEK ÖLÇÜMLERİ ---
+# Her isteğin süresi /metrics üzerinden histogram olarak sunulur.
+# SERVER_TIMING=1 ise isteğin adım süreleri (depolama, upstream, hesaplama) 'Server-Timing' başlığında döner.
+# PROFILE_SAMPLE_RATE (0-1) oranındaki istekler, PROFILE_ON_DEMAND=1 ise 'X-Profile: 1' başlıklı
+# istekler cProfile ile profillenir ve PROFILE_DIR altına .prof dosyası olarak yazılır.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_ON_DEMAND = os.environ.get('PROFILE_ON_DEMAND', '0') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+http_request_seconds = metrics.registry.histogram(
+    'fon_takip_http_request_seconds', 'HTTP isteklerinin toplam süresi', ('endpoint', 'method', 'status')
+)
+# Aynı anda tek bir profil (cProfile eşzamanlı iki profilleyiciye izin vermez)
+_profile_lock = threading.Lock()
+
+
+def _should_profile():
+    if PROFILE_ON_DEMAND and request.headers.get('X-Profile') == '1':
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.metrics_token = metrics.start_request()
+    g.profiler = None
+    if _should_profile() and _profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    started = g.pop('request_started', None)
+    token = g.pop('metrics_token', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    spans = metrics.finish_request(token)
+    http_request_seconds.observe(
+        elapsed, endpoint=request.endpoint or 'unmatched', method=request.method, status=response.status_code
+    )
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing_header(spans, elapsed)
+    return response
+
+
+@app.teardown_request
+def _finish_request_profile(error=None):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(
+            PROFILE_DIR,
+            f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{request.endpoint or 'unmatched'}_{uuid.uuid4().hex[:8]}.prof"
+        )
+        profiler.dump_stats(path)
+        print(f"İstek profili kaydedildi: {request.method} {request.path} -> {path}")
     except Exception as e:
-        print(f"Supabase'e veri kaydedilirken hata: {e}")
+        print(f"İstek profili kaydedilemedi: {e}")
+    finally:
+        _profile_lock.release()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metin biçiminde metrikler."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 
 # --- YARDIMCI HESAPLAMA FONKSİYONU ---
 
 # GÜNCELLENDİ: ARTIK HEM STOCKS HEM DE FUNDS HESAPLANIYOR!
 def _calculate_portfolio_return(stocks, funds):
     """
-    Verilen hisse ve fon listesi için portföy getirisini yfinance kullanarak hesaplar.
+    Verilen hisse ve fon listesi için portföy getirisini hesaplar.
+    Hesaplama, tüm fonlar için kullanılan PortfolioReturnEngine'in tek portföylük halidir.
     """
-    total_portfolio_change = 0.0
-    asset_details = []
-    
-    # Stocks ve Funds listelerini birleştirip tek havuzda işleyelim
-    # Her birine 'asset_type' etiketi ekliyoruz
-    all_assets = []
-    for s in stocks:
-        item = s.copy()
-        item['asset_type'] = 'stock'
-        all_assets.append(item)
-    for f in funds:
-        item = f.copy()
-        item['asset_type'] = 'fund'
-        # Fonların borsa tipi genelde BIST'tir
-        if 'borsa_tipi' not in item: item['borsa_tipi'] = 'bist' 
-        all_assets.append(item)
-
-    for asset in all_assets:
-        ticker = asset.get('ticker', '').strip().upper()
-        try:
-            weight = float(asset.get('weight', 0))
-        except:
-            weight = 0.0
-            
-        asset_type = asset.get('asset_type', 'stock')
-        borsa_tipi = asset.get('borsa_tipi', 'bist')
-        
-        # 1. HATA KONTROLÜ: İsimsiz veya ağırlıksızları atla
-        if not ticker or weight == 0: continue
-        
-        # 2. NAKİT KONTROLÜ: Bunların getirisi 0'dır
-        if ticker in ['NAKIT', 'CASH', 'TAHVIL', 'BOND', 'DEVLET TAHVILI', 'TRY', 'TL']:
-            asset_details.append({
-                'type': asset_type, 
-                'ticker': ticker.capitalize(), 
-                'daily_change': 0.0, 
-                'weighted_impact': 0.0
-            })
-            continue
-            
-        # 3. YAHOO SEMBOLÜNÜ BELİRLE
-        if borsa_tipi == 'bist':
-            yf_ticker = ticker + '.IS'
-        else: # 'yabanci' ise olduğu gibi kullan
-            yf_ticker = ticker
-            
-        try:
-            # 4. VERİ ÇEKME (yfinance ile)
-            t = yf.Ticker(yf_ticker)
-            
-            # Son 5 günün verisini al (Hafta sonu boşluklarını aşmak için)
-            hist = t.history(period="5d")
-            
-            if len(hist) < 2:
-                # Veri bulunamazsa (Örn: Yeni halka arz veya hatalı kod)
-                asset_details.append({
-                    'type': asset_type, 
-                    'ticker': ticker, 
-                    'daily_change': 0.0, 
-                    'weighted_impact': 0.0, 
-                    'error': 'Veri Yok'
-                })
-                continue
-
-            # Kapanış fiyatlarını al
-            latest_price = hist['Close'].iloc[-1]
-            prev_close = hist['Close'].iloc[-2]
-
-            # 5. MATEMATİKSEL HESAPLAMA
-            # Yüzdelik Değişim: (Yeni - Eski) / Eski * 100
-            daily_change = ((latest_price - prev_close) / prev_close) * 100
-            
-            # Ağırlıklı Etki: (Ağırlık / 100) * Yüzdelik Değişim
-            weighted_impact = (weight / 100) * daily_change
-            
-            # Toplam portföy getirisine ekle
-            total_portfolio_change += weighted_impact
-            
-            asset_details.append({
-                'type': asset_type, 
-                'ticker': ticker, 
-                'daily_change': daily_change, 
-                'weighted_impact': weighted_impact
-            })
+    from market_data import get_quotes, quote_staleness
+    with metrics.span('compute.engine_build'):
+        engine = PortfolioReturnEngine.from_assets(stocks, funds)
+    missing_label, stale_ages = 'Veri Yok', None
+    try:
+        # Gerekli tüm fiyatlar tek bir toplu istekle çekilir
+        quotes = get_quotes(engine.symbols)
+        changes = engine.price_changes(quotes)
+        stale_ages = quote_staleness(quotes, engine.symbols)
+    except Exception as e:
+        # Ne güncel ne de son bilinen fiyat alınabildiyse fiyatlı varlıklar 0 döner
+        print(f"Hata ({', '.join(engine.symbols)}): {e}")
+        changes = engine.missing_changes()
+        missing_label = 'Hata'
 
-        except Exception as e:
-            # Herhangi bir hata olursa (İnternet kesintisi vb.) 0 dön
-            print(f"Hata ({ticker}): {e}") 
-            asset_details.append({
-                'type': asset_type, 
-                'ticker': ticker, 
-                'daily_change': 0.0, 
-                'weighted_impact': 0.0, 
-                'error': 'Hata'
-            })
-    
-    # Listeyi en çok kazandırandan kaybettirene doğru sırala
-    asset_details.sort(key=lambda x: x.get('weighted_impact', 0), reverse=True)
-            
-    return {'total_change': total_portfolio_change, 'details': asset_details}
+    with metrics.span('compute.portfolio_return'):
+        details = engine.asset_details(None, changes, missing_label, stale_ages)
+        return {
+            'total_change': float(engine.total_returns(changes)[0]),
+            'details': details,
+            **_staleness(details)
+        }
+
+def _staleness(details):
+    """
+    Sonucun eski fiyat içerip içermediği: upstream erişilemezken son bilinen fiyatlar kullanılır ve
+    arayüz bunu '0' göstermek yerine işaretler. stale_age en eski fiyatın yaşıdır (sn).
+    """
+    ages = [d['stale_age'] for d in details if d.get('stale')]
+    return {'stale': bool(ages), 'stale_age': max(ages) if ages else None}
 
 # --- API ENDPOINT'LERİ ---
 # (Değişiklik yok)
@@ -170,39 +196,34 @@ def _calculate_portfolio_return(stocks, funds):
 def index():
     return render_template('index.html')
 
+def _conditional_json(etag, build_payload):
+    """
+    İstemcinin elindeki sürüm güncelse (If-None-Match) gövdesiz 304, değilse JSON gövdeyi ETag ile döner.
+    'no-cache' sayesinde tarayıcı yanıtı saklar ama her seferinde sunucuya doğrulatır.
+    """
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/get_portfolios', methods=['GET'])
 def get_portfolios():
-    portfolios = load_portfolios()
-    
-    portfolio_list = []
-    for name, data_container in portfolios.items():
-        current_data = data_container.get('current')
-        
-        if current_data:
-            portfolio_list.append({
-                'name': current_data.get('name', name), 
-                'fonTipi': current_data.get('fonTipi'), 
-                'altKategori': current_data.get('altKategori'),
-                'yonetim_tipi': current_data.get('yonetim_tipi')
-            })
-        else:
-            portfolio_list.append({
-                'name': name, 
-                'fonTipi': None, 
-                'altKategori': None,
-                'yonetim_tipi': None
-            })
-
-    sorted_list = sorted(portfolio_list, key=lambda p: p['name'])
-    return jsonify(sorted_list)
+    # Sadece isim ve kategoriler; hisse/fon listeleri ve geçmiş versiyonlar kullanılmaz
+    portfolio_list, etag = portfolio_store.metadata()
+    return _conditional_json(etag, lambda: portfolio_list)
 
 
 @app.route('/get_portfolio/<portfolio_name>', methods=['GET'])
 def get_portfolio(portfolio_name):
-    portfolios = load_portfolios()
-    portfolio_data = portfolios.get(portfolio_name)
+    portfolio_data = portfolio_store.all().get(portfolio_name)
     if portfolio_data and 'current' in portfolio_data:
-        return jsonify(portfolio_data['current'])
+        response = _conditional_json(portfolio_store.etag(portfolio_name), lambda: portfolio_data['current'])
+        # Düzenleyici kaydederken bu versiyonu 'expected_version' olarak geri gönderir
+        response.headers['X-Portfolio-Version'] = str(portfolio_version(portfolio_data))
+        return response
     return jsonify({'error': 'Portföy bulunamadı'}), 404
 
 @app.route('/save_portfolio', methods=['POST'])
@@ -223,9 +244,29 @@ def save_portfolio():
     if not portfolio_name or (not stocks and not funds):
         return jsonify({'error': 'Portföy adı ve en az bir varlık girilmelidir'}), 400
     
-    portfolios = load_portfolios()
-    portfolio_container = portfolios.get(portfolio_name, {'current': None, 'history': []})
-    
+    # İyimser kilit: düzenleyicinin okuduğu versiyon (yeni portföyde gönderilmez)
+    expected_version = data.get('expected_version')
+    if expected_version is not None:
+        try:
+            expected_version = int(expected_version)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Geçersiz versiyon bilgisi.'}), 400
+
+    # Geçmiş, düzenleyicinin okuduğu versiyonun üzerine kurulur; bellekteki kopya o versiyonda
+    # değilse kayıt arka uçtan tazelenir. Versiyon gönderilmediyse burada okunan versiyon esas alınır.
+    try:
+        portfolio_container = portfolio_store.get_for_update(portfolio_name, expected_version)
+    except Exception as e:
+        print(f"Portföy okunurken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
+    conflict_message = f'"{portfolio_name}" portföyü siz düzenlerken başka biri tarafından değiştirildi. Lütfen portföyü yeniden açıp tekrar deneyin.'
+    if expected_version is None:
+        if portfolio_container is not None:
+            expected_version = portfolio_version(portfolio_container)
+    elif portfolio_version(portfolio_container) != expected_version:
+        return jsonify({'error': conflict_message}), 409
+    portfolio_container = portfolio_container or {'current': None, 'history': []}
+
     if portfolio_container.get('current'):
         previous_version = portfolio_container['current']
         previous_version['save_timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -233,7 +274,7 @@ def save_portfolio():
             del previous_version['save_date']
         
         portfolio_container['history'].insert(0, previous_version)
-        portfolio_container['history'] = portfolio_container['history'][:5]
+        portfolio_container['history'] = portfolio_container['history'][:PORTFOLIO_HISTORY_LIMIT]
 
     new_current_version = {
         'name': portfolio_name, 
@@ -245,9 +286,14 @@ def save_portfolio():
     }
     
     portfolio_container['current'] = new_current_version
-    portfolios[portfolio_name] = portfolio_container
     
-    save_portfolios(portfolios)
+    try:
+        portfolio_store.save(portfolio_name, portfolio_container, expected_version)
+    except PortfolioConflictError:
+        return jsonify({'error': conflict_message}), 409
+    except Exception as e:
+        print(f"Portföy kaydedilirken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
     return jsonify({'success': f'"{portfolio_name}" portföyü başarıyla kaydedildi.'})
 
 
@@ -267,56 +313,266 @@ def calculate():
     result = _calculate_portfolio_return(stocks, funds)
     return jsonify(result)
 
+# --- TOPLU HESAPLAMA ---
+# Çok sayıda aday portföy tek istekte hesaplanır: sembollerin birleşimi bir kez çekilir,
+# ağırlık bazlı getiriler tek bir matris-vektör çarpımıyla bulunur ve sonuçlar NDJSON olarak akıtılır.
+CALCULATE_BATCH_LIMIT = int(os.environ.get('CALCULATE_BATCH_LIMIT', 5000))
+
+@app.route('/calculate_batch', methods=['POST'])
+def calculate_batch():
+    """
+    Gövde: {"portfolios": [{"id": ..., "stocks": [...], "funds": [...], "dynamic": false}, ...]}
+    (ya da doğrudan liste). "dynamic": true olan portföyler adetlerden hesaplanan dinamik
+    ağırlıklarla (/calculate_dynamic_weights), diğerleri kayıtlı ağırlıklarla (/calculate) hesaplanır.
+    Her satır {"index", "id", "total_change", "details"} ya da {"index", "id", "error"} içerir.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('portfolios') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({'error': 'Geçersiz istek. "portfolios" listesi bekleniyor.'}), 400
+    if len(items) > CALCULATE_BATCH_LIMIT:
+        return jsonify({'error': f'Tek istekte en fazla {CALCULATE_BATCH_LIMIT} portföy hesaplanabilir.'}), 400
+    from market_data import get_quotes, quote_staleness
+
+    positions, errors = {}, {}
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not (item.get('stocks') or item.get('funds')):
+            errors[i] = 'Hesaplanacak veri gönderilmedi.'
+            continue
+        positions[i] = PortfolioPositions(item.get('stocks', []), item.get('funds', []))
+    dynamic = {i for i in positions if items[i].get('dynamic')}
+
+    with metrics.span('compute.engine_build'):
+        engine = PortfolioReturnEngine({i: p for i, p in positions.items() if i not in dynamic})
+    symbols = list(engine.symbols)
+    for i in dynamic:
+        symbols += _dynamic_weight_symbols(positions[i])
+
+    quotes, quote_error, stale_ages = None, None, None
+    missing_label = 'Veri Yok'
+    try:
+        # Tüm portföylerin fiyatları tek bir toplu istekle çekilir
+        quotes = get_quotes(symbols)
+        changes = engine.price_changes(quotes)
+        stale_ages = quote_staleness(quotes, engine.symbols)
+    except Exception as e:
+        print(f"Toplu hesaplama için fiyat verisi alınırken hata: {e}")
+        quote_error = e
+        changes = engine.missing_changes()
+        missing_label = 'Hata'
+    with metrics.span('compute.portfolio_return'):
+        totals = dict(zip(engine.names, engine.total_returns(changes).tolist()))
+
+    def generate():
+        for i, item in enumerate(items):
+            line = {'index': i, 'id': item.get('id') if isinstance(item, dict) else None}
+            if i in errors:
+                line['error'] = errors[i]
+            elif i in dynamic:
+                result, error = _dynamic_weight_return(positions[i], quotes, quote_error)
+                line.update(result if error is None else {'error': error})
+            else:
+                details = engine.asset_details(i, changes, missing_label, stale_ages)
+                line.update({'total_change': totals[i], 'details': details, **_staleness(details)})
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Ağırlık matrisi sadece portföyler değiştiğinde yeniden kurulur.
+# Depo her yazmada yeni bir sözlük oluşturduğundan, sözlüğün kimliği değişiklik göstergesidir.
+_engine_cache = {'source': None, 'engine': None}
+
+def _current_engine():
+    portfolios = portfolio_store.all()
+    if _engine_cache['source'] is not portfolios:
+        with metrics.span('compute.engine_build'):
+            _engine_cache['engine'] = PortfolioReturnEngine.from_portfolios(portfolios, portfolio_positions)
+        _engine_cache['source'] = portfolios
+    return _engine_cache['engine']
+
+def _fund_returns(engine):
+    """
+    Motordaki portföylerin günlük getirileri ({'name', 'return', 'stale', 'missing'} listesi).
+    Tüm portföyler tek bir ağırlık matrisinde toplanır; sembollerin birleşimi tek seferde çekilir.
+    Hiçbir varlığı için fiyat (son bilinen fiyat dahil) bulunamayan portföylerde 'missing' True,
+    'return' None olur; böylece veri yokluğu %0 getiri gibi görünmez.
+    """
+    from market_data import get_quotes, quote_staleness
+    stale = np.zeros(len(engine.names), dtype=bool)
+    try:
+        quotes = get_quotes(engine.symbols)
+        changes = engine.price_changes(quotes)
+        stale = engine.stale_flags(quote_staleness(quotes, engine.symbols))
+    except Exception as e:
+        print(f"Toplu fiyat verisi alınırken hata: {e}")
+        changes = engine.missing_changes()
+    
+    # Hissesi olmayan fonlar 0 getiri döner
+    with metrics.span('compute.fund_returns'):
+        totals = engine.total_returns(changes)
+        missing = engine.missing_flags(changes)
+        return [
+            {'name': name, 'return': None if is_missing else float(total), 'stale': bool(is_stale),
+             'missing': bool(is_missing)}
+            for name, total, is_stale, is_missing in zip(engine.names, totals, stale, missing)
+        ]
+
+def _compute_all_fund_returns():
+    """
+    Tüm kayıtlı portföylerin günlük getirilerini hesaplar.
+    """
+    return _fund_returns(_current_engine())
+
+# Fon getirileri arka planda periyodik olarak hesaplanır; istekler bellekteki son sonucu okur
+# SHARED_CACHE_PATH verildiyse sonuç worker'lar arasında paylaşılır; aynı portföy durumu için tek worker hesaplar
+def _portfolio_state_key():
+    """Portföy deposunun süreçler arası karşılaştırılabilir özeti (isimler ve versiyonlar)."""
+    return content_etag(sorted((name, portfolio_version(c)) for name, c in portfolio_store.all().items()))
+
+ranking_refresher = SnapshotRefresher(
+    'fund-returns', _compute_all_fund_returns, float(os.environ.get('RANKING_REFRESH_INTERVAL', 60)),
+    shared=shared_cache, shared_key=_portfolio_state_key
+)
+portfolio_store.on_change(lambda name: ranking_refresher.request_refresh())
+
+# Canlı sıralama akışı: her yeni hesaplamada sadece getirisi değişen fonlar yayınlanır
+fund_return_feed = DeltaFeed('name')
+ranking_refresher.on_update(fund_return_feed.publish)
+SSE_KEEPALIVE = float(os.environ.get('SSE_KEEPALIVE', 15))
+
 @app.route('/get_all_fund_returns', methods=['GET'])
 def get_all_fund_returns():
     """
-    Tüm kayıtlı portföylerin günlük getirilerini hesaplar.
+    Tüm kayıtlı portföylerin günlük getirilerini arka planda hazırlanan son sonuçtan döner.
+    Sonucun hesaplandığı an 'X-Computed-At' başlığında bildirilir.
     """
-    portfolios = load_portfolios()
-    all_returns = []
-    
-    for name, data_container in portfolios.items():
-        portfolio_data = data_container.get('current')
-        if not portfolio_data:
-            continue
-            
-        stocks = portfolio_data.get('stocks', [])
-        funds = portfolio_data.get('funds', []) 
-        
-        if not stocks and not funds: # Hissesi olmayan fonlar 0 getiri döner
-               all_returns.append({
-                   'name': name,
-                   'return': 0.0
-               })
-               continue
-            
-        # GÜNCELLENDİ: Artık hem hisseler hem fonlar fonksiyona gönderiliyor
-        calculation_result = _calculate_portfolio_return(stocks, funds)
-        
-        all_returns.append({
-            'name': name,
-            'return': calculation_result.get('total_change', 0)
-        })
-        
-    return jsonify(all_returns)
+    all_returns, computed_at = ranking_refresher.get()
+    response = jsonify(all_returns)
+    response.headers['X-Computed-At'] = computed_at
+    return response
+
+
+# --- GÜN İÇİ TAHMİNİ NAV ---
+# Tüm portföylerin sembol birleşimi için gün içi barlar her döngüde tek seferde çekilir ve
+# tüm fonların tahmini NAV eğrisi (önceki kapanış = 100) tek bir matris hesabıyla üretilir.
+# İstemciler arka planda hazırlanan ortak sonucu okur.
+
+def _compute_intraday_nav():
+    from market_data import get_quotes, get_intraday_prices, ISTANBUL_TZ, INTRADAY_INTERVAL
+    engine = _current_engine()
+    quotes = get_quotes(engine.symbols)
+    prices = get_intraday_prices(engine.symbols)
+    if prices.empty:
+        return {'interval': INTRADAY_INTERVAL, 'times': [], 'funds': []}
+
+    with metrics.span('compute.intraday_nav'):
+        returns = engine.total_returns_series(engine.price_change_series(prices, quotes))
+        nav = np.round(100 + returns, 4)
+        return {
+            'interval': INTRADAY_INTERVAL,
+            'times': prices.index.tz_convert(ISTANBUL_TZ).strftime('%Y-%m-%dT%H:%M').tolist(),
+            'funds': [
+                {'name': name, 'nav': nav[:, i].tolist(), 'return': float(returns[-1, i])}
+                for i, name in enumerate(engine.names)
+            ]
+        }
+
+intraday_refresher = SnapshotRefresher(
+    'intraday-nav', _compute_intraday_nav, float(os.environ.get('INTRADAY_REFRESH_INTERVAL', 60)),
+    shared=shared_cache, shared_key=_portfolio_state_key
+)
+portfolio_store.on_change(lambda name: intraday_refresher.request_refresh())
+
+@app.route('/get_intraday_nav', methods=['GET'])
+def get_intraday_nav():
+    """
+    Fonların gün içi tahmini NAV eğrileri. '?name=' (birden fazla verilebilir) ile fon seçilebilir.
+    Sonucun hesaplandığı an 'X-Computed-At' başlığında bildirilir.
+    """
+    try:
+        payload, computed_at = intraday_refresher.get()
+    except Exception as e:
+        print(f"Gün içi NAV hesaplanırken hata: {e}")
+        return jsonify({'error': 'Gün içi veriler alınamadı.'}), 503
+
+    names = set(request.args.getlist('name'))
+    funds = [f for f in payload['funds'] if f['name'] in names] if names else payload['funds']
+    response = jsonify({'interval': payload['interval'], 'times': payload['times'], 'funds': funds})
+    response.headers['X-Computed-At'] = computed_at
+    return response
+
+
+def _sse_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/stream/fund_returns', methods=['GET'])
+def stream_fund_returns():
+    """
+    Fon getirilerini Server-Sent Events olarak yayınlar. Bağlantıda tam liste ('snapshot'),
+    sonrasında her fiyat güncellemesinde sadece değişen fonlar ('delta') gönderilir.
+    Boşta bekleyen bağlantılar hesaplama yapmaz, ancak bağlantı açık kaldığı sürece worker'ı tutar;
+    bu yüzden uygulama gunicorn.conf.py'deki gevent worker sınıfıyla çalıştırılır (sync worker'da
+    her açık sekme bir worker sürecini tamamen meşgul eder).
+    """
+    # İlk hesaplama henüz yapılmadıysa burada yapılır ve akışa yayınlanır
+    ranking_refresher.get()
+
+    # Olay kimliği '<epoch>-<sıra>' biçimindedir; yeniden bağlantı başka bir worker'a düştüyse
+    # (epoch farklı) ya da kimlik tanınmıyorsa tam liste gönderilir
+    resume_from = fund_return_feed.parse_event_id(request.headers.get('Last-Event-ID'))
+
+    def generate():
+        seq = resume_from
+        if seq is None:
+            seq, returns, computed_at = fund_return_feed.snapshot()
+            yield _sse_event('snapshot', {'returns': returns, 'computed_at': computed_at},
+                             fund_return_feed.event_id(seq))
+        while True:
+            deltas = fund_return_feed.wait(seq, SSE_KEEPALIVE)
+            if deltas is None:
+                # İstemci çok geride kaldı; tam listeyi yeniden gönder
+                seq, returns, computed_at = fund_return_feed.snapshot()
+                yield _sse_event('snapshot', {'returns': returns, 'computed_at': computed_at},
+                                 fund_return_feed.event_id(seq))
+            elif not deltas:
+                yield ': keepalive\n\n'
+            else:
+                for seq, delta in deltas:
+                    yield _sse_event('delta', delta, fund_return_feed.event_id(seq))
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# --- KONTROL PANELİ TAKİP LİSTELERİ ---
+# Takip listeleri sunucuda isimli nesneler olarak tutulur; /get_tracked_funds ve /save_tracked_funds
+# varsayılan listeyi okur/yazar. /get_tracked_fund_returns sadece listedeki fonların getirisini
+# hesaplar (fiyatlar ortak önbellekten) ve sonucu liste + portföy deposu versiyonu bazında saklar.
+WATCHLIST_RETURN_TTL = float(os.environ.get('WATCHLIST_RETURN_TTL', 60))
+_watchlist_return_cache = QuoteCache(int(os.environ.get('WATCHLIST_CACHE_SIZE', 256)), lambda: WATCHLIST_RETURN_TTL)
+
+def _watchlist_returns(funds):
+    """(getiriler, kayıtlı olmayan fonlar, hesaplanma zamanı) döner; getiriler liste sırasındadır."""
+    portfolios = portfolio_store.all()
+    names = tuple(name for name in funds if name in portfolios)
 
+    def load():
+        with metrics.span('compute.engine_build'):
+            engine = PortfolioReturnEngine.from_portfolios({n: portfolios[n] for n in names}, portfolio_positions)
+        records = _fund_returns(engine) if engine.names else []
+        return records, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-# --- KONTROL PANELİ TAKİP LİSTESİ API'LERİ ---
-# (Bu bölümde değişiklik yapılmadı)
+    records, computed_at = _watchlist_return_cache.get_or_load((names, portfolio_store.version), load)
+    return records, [name for name in funds if name not in portfolios], computed_at
 
 @app.route('/get_tracked_funds', methods=['GET'])
 def get_tracked_funds():
     try:
-        response = supabase.table('control_panel_data') \
-                           .select('value') \
-                           .eq('key', 'tracked_funds') \
-                           .maybe_single() \
-                           .execute()
-        
-        if response.data and response.data.get('value'):
-            return jsonify(response.data['value'])
-        else:
-            return jsonify([])
+        return jsonify(watchlist_store.get(DEFAULT_WATCHLIST))
     except Exception as e:
         print(f"Takip listesi alınırken hata: {e}")
         return jsonify({'error': f'Sunucu hatası: {e}'}), 500
@@ -328,83 +584,250 @@ def save_tracked_funds():
         return jsonify({'error': 'Geçersiz veri formatı. Bir liste bekleniyordu.'}), 400
         
     try:
-        supabase.table('control_panel_data') \
-                .upsert({'key': 'tracked_funds', 'value': fund_list}) \
-                .execute()
-
+        watchlist_store.save(DEFAULT_WATCHLIST, fund_list)
         return jsonify({'success': 'Takip listesi başarıyla güncellendi.'})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Takip listesi kaydedilirken hata: {e}")
         return jsonify({'error': f'Sunucu hatası: {e}'}), 500
 
-# --- YENİ API'LERİN SONU ---
+@app.route('/get_watchlists', methods=['GET'])
+def get_watchlists():
+    """Tüm takip listeleri: {liste adı: [fon adları]}."""
+    try:
+        return jsonify({DEFAULT_WATCHLIST: [], **watchlist_store.all()})
+    except Exception as e:
+        print(f"Takip listeleri alınırken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
+
+@app.route('/save_watchlist', methods=['POST'])
+def save_watchlist():
+    """Gövde: {"name": "liste adı", "funds": ["FON1", ...]}. Liste yoksa oluşturulur."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Geçersiz istek. JSON verisi veya Content-Type başlığı eksik.'}), 400
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'Takip listesi adı belirtilmedi.'}), 400
+
+    try:
+        funds = watchlist_store.save(name, data.get('funds'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Takip listesi kaydedilirken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
+    return jsonify({'success': f'"{name}" takip listesi kaydedildi.', 'funds': funds})
+
+@app.route('/delete_watchlist', methods=['POST'])
+def delete_watchlist():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('name'):
+        return jsonify({'error': 'Silinecek takip listesi adı belirtilmedi.'}), 400
+
+    try:
+        deleted = watchlist_store.delete(data['name'])
+    except Exception as e:
+        print(f"Takip listesi silinirken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
+    if not deleted:
+        return jsonify({'error': 'Silinecek takip listesi bulunamadı.'}), 404
+    return jsonify({'success': f'"{data["name"]}" takip listesi silindi.'})
+
+@app.route('/get_tracked_fund_returns', methods=['GET'])
+def get_tracked_fund_returns():
+    """
+    Takip listesindeki fonların günlük getirileri ('?watchlist=' verilmezse varsayılan liste).
+    Dönüş: {"watchlist", "funds": [{"name", "return", "stale"}], "missing": [kayıtlı olmayan fonlar]}.
+    Sonucun hesaplandığı an 'X-Computed-At' başlığında bildirilir.
+    """
+    name = request.args.get('watchlist', DEFAULT_WATCHLIST)
+    try:
+        funds = watchlist_store.get(name)
+    except Exception as e:
+        print(f"Takip listesi alınırken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
+    if funds is None:
+        return jsonify({'error': f'"{name}" takip listesi bulunamadı.'}), 404
+
+    records, missing, computed_at = _watchlist_returns(funds)
+    response = jsonify({'watchlist': name, 'funds': records, 'missing': missing})
+    response.headers['X-Computed-At'] = computed_at
+    return response
 
 
+# Geriye dönük grafik için seçilebilen dönemler (gün)
+HISTORICAL_PERIODS = {'45d': 45, '90d': 90, '1y': 365}
+
 # GÜNCELLENDİ: Bu fonksiyon artık SADECE hisse senetleri için geçmiş hesabı yapar.
 # (Değişiklik yok)
 @app.route('/calculate_historical/<portfolio_name>', methods=['GET'])
 def calculate_historical(portfolio_name):
-    portfolios = load_portfolios()
-    portfolio_container = portfolios.get(portfolio_name)
+    portfolio_container = portfolio_store.all().get(portfolio_name)
     if not portfolio_container: return jsonify({'error': 'Portföy bulunamadı'}), 404
     portfolio = portfolio_container.get('current')
     if not portfolio: return jsonify({'error': 'Portföyün güncel versiyonu bulunamadı.'}), 404
     
-    end_date, start_date = date.today(), date.today() - timedelta(days=45)
+    # Geriye bakış süresi: varsayılan 45 gün (son 30 getiri); '90d', '1y' veya 'ytd' seçilebilir
+    period = request.args.get('period', '45d').lower()
+    end_date = date.today()
+    if period == 'ytd':
+        start_date = date(end_date.year, 1, 1)
+    elif period in HISTORICAL_PERIODS:
+        start_date = end_date - timedelta(days=HISTORICAL_PERIODS[period])
+    else:
+        return jsonify({'error': f"Geçersiz dönem: '{period}'. Kullanılabilir: 45d, 90d, 1y, ytd"}), 400
     
-    # 'all_assets' ağırlık hesabı için hala 'funds' içerebilir, bu sorun değil.
-    all_assets = portfolio.get('stocks', []) + portfolio.get('funds', [])
-    if not all_assets: return jsonify({'error': 'Portföyde hesaplanacak varlık yok.'}), 400
+    positions = portfolio_positions.get(portfolio_name, portfolio_container)
+    if not len(positions): return jsonify({'error': 'Portföyde hesaplanacak varlık yok.'}), 400
     
+    # Sadece hisseler dikkate alınır (fonların tarihsel fiyatı yok); sütunlar Yahoo sembolüdür
+    import pandas as pd
+    from market_data import get_close_history
     asset_prices_df = pd.DataFrame()
-    stocks_in_portfolio = portfolio.get('stocks', [])
-    
-    if stocks_in_portfolio:
-        stock_tickers_is = []
-        for s in stocks_in_portfolio:
-            ticker = s['ticker'].strip().upper()
-            borsa_tipi = s.get('borsa_tipi', 'bist') 
-            
-            if borsa_tipi == 'bist':
-                stock_tickers_is.append(ticker + '.IS')
-            else: # 'yabanci' ise
-                stock_tickers_is.append(ticker)
-                
+    if positions.stock_symbols:
         try:
-            stock_data = yf.download(stock_tickers_is, start=start_date, end=end_date, progress=False)
-            if not stock_data.empty:
-                close_prices = stock_data['Close'] if len(stock_tickers_is) > 1 else stock_data[['Close']]
-                asset_prices_df = pd.concat([asset_prices_df, close_prices], axis=1)
+            asset_prices_df = get_close_history(positions.stock_symbols, start_date, end_date)
         except Exception as e:
             print(f"Hisse senedi verisi alınırken hata: {e}")
-            
-    # --- TEFAS İLE İLGİLİ TÜM BLOK KALDIRILDI ---
-    # (for fund in portfolio.get('funds', []): ... bloğu silindi)
 
     if asset_prices_df.empty: return jsonify({'error': 'Tarihsel veri bulunamadı (Sadece hisseler dikkate alındı).'}), 400
     
-    asset_prices_df.columns = asset_prices_df.columns.str.replace('.IS', '', regex=False)
-    
-    asset_prices_df = asset_prices_df.ffill().dropna(how='all')
-    daily_returns = asset_prices_df.pct_change()
-    
-    # Ağırlık sözlüğü hem hisseleri hem fonları içerebilir
-    weights_dict = {asset['ticker'].strip().upper(): float(asset['weight']) / 100 for asset in all_assets}
-    
-    # 'reindex' sayesinde SADECE 'daily_returns.columns' (yani hisseler) için olan ağırlıklar kalır.
-    # Fonların ağırlıkları otomatik olarak 0'lanır. Bu tam istediğimiz şey.
-    aligned_weights = pd.Series(weights_dict).reindex(daily_returns.columns).fillna(0)
-    
-    portfolio_daily_returns = (daily_returns * aligned_weights).sum(axis=1) * 100
-    valid_returns = portfolio_daily_returns.dropna()
-    dates = valid_returns.index.strftime('%d.%m.%Y').tolist()[-30:]
-    returns = valid_returns.tolist()[-30:]
+    with metrics.span('compute.historical'):
+        asset_prices_df = asset_prices_df.ffill().dropna(how='all')
+        daily_returns = asset_prices_df.pct_change()
+
+        # Ağırlıklar önceden hazırlanmış sembol indeksli seriden sütun sırasına hizalanır
+        aligned_weights = positions.aligned_stock_weights(daily_returns.columns)
+
+        portfolio_daily_returns = (daily_returns * aligned_weights).sum(axis=1) * 100
+        valid_returns = portfolio_daily_returns.dropna()
+        if period == '45d':
+            valid_returns = valid_returns[-30:]
+        dates = valid_returns.index.strftime('%d.%m.%Y').tolist()
+        returns = valid_returns.tolist()
     return jsonify({'dates': dates, 'returns': returns})
 
+# --- TOPLU PORTFÖY ANALİZİ ---
+# Tüm portföylerin dönemsel getirileri ve risk ölçütleri tek bir hizalı kapanış matrisinden hesaplanır.
+# Sonuç işlem günü başına bir kez üretilir (anahtar: gün + ağırlık matrisi); portföyler değişince yenilenir.
+BENCHMARK_SYMBOL = os.environ.get('BENCHMARK_SYMBOL', 'XU100.IS')
+_analytics_cache = QuoteCache(4, lambda: 24 * 3600)
+# Kapanışı eksik semboller varken üretilen sonuç gün boyu değil, bu süre kadar tutulur
+ANALYTICS_PARTIAL_TTL = float(os.environ.get('ANALYTICS_PARTIAL_TTL', 300))
+
+def _portfolio_analytics():
+    from market_data import get_close_history, ISTANBUL_TZ
+    engine = _current_engine()
+    today = datetime.now(ISTANBUL_TZ).date()
+    key = (today, engine)
+    partial = False
+
+    def load():
+        nonlocal partial
+        symbols = engine.symbols + [BENCHMARK_SYMBOL]
+        closes = get_close_history(symbols, history_start(today), today)
+        partial = not set(symbols) <= set(closes.columns)
+        with metrics.span('compute.analytics'):
+            values = portfolio_analytics(engine, closes, BENCHMARK_SYMBOL, today)
+            return analytics_table(engine, values)
+
+    result = _analytics_cache.get_or_load(key, load)
+    if partial:
+        # Upstream kesintisinde eksik kalan kapanışlar kısa süre sonra yeniden denenir
+        _analytics_cache.set(key, result, ttl=ANALYTICS_PARTIAL_TTL)
+    rows, rankings = result
+    return today, rows, rankings
+
+@app.route('/get_portfolio_analytics', methods=['GET'])
+def get_portfolio_analytics():
+    """
+    Kayıtlı tüm portföyler için 1H/1A/3A/YB/1Y getirileri, volatilite, en büyük düşüş,
+    endekse (XU100) göre beta ve takip hatası.
+    '?sort=<ölçüt>&order=asc|desc&limit=N' ile önceden hazırlanmış sıralamadan okunur.
+    """
+    sort = request.args.get('sort')
+    if sort is not None and sort not in ANALYTICS_METRICS:
+        return jsonify({'error': f"Geçersiz ölçüt: '{sort}'. Kullanılabilir: {', '.join(ANALYTICS_METRICS)}"}), 400
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'limit bir tam sayı olmalı.'}), 400
+
+    try:
+        as_of, rows, rankings = _portfolio_analytics()
+    except Exception as e:
+        print(f"Portföy analizleri hesaplanırken hata: {e}")
+        return jsonify({'error': 'Tarihsel veriler alınamadı.'}), 503
+
+    if sort is not None:
+        by_name = {row['name']: row for row in rows}
+        order = rankings[sort]
+        if request.args.get('order', 'desc').lower() == 'asc':
+            # Değeri olmayanlar her iki yönde de sonda kalır
+            valued = order[:sum(by_name[n][sort] is not None for n in order)]
+            order = valued[::-1] + order[len(valued):]
+        rows = [by_name[name] for name in order]
+    if limit is not None:
+        rows = rows[:max(limit, 0)]
+
+    return jsonify({
+        'as_of': as_of.isoformat(),
+        'benchmark': BENCHMARK_SYMBOL,
+        'metrics': ANALYTICS_METRICS,
+        'portfolios': rows
+    })
+
+# --- VARLIK BAZLI MARUZİYET ---
+
+def _lookthrough():
+    fund_lookthrough.sync(portfolio_store.all, portfolio_positions.get)
+    return fund_lookthrough
+
+@app.route('/get_ticker_exposure/<ticker>', methods=['GET'])
+def get_ticker_exposure(ticker):
+    """Varlığı tutan fonlar, ağırlığa göre büyükten küçüğe."""
+    ticker = ticker.strip().upper()
+    index = _lookthrough()
+    holders = sorted(index.holders(ticker).items(), key=lambda item: item[1], reverse=True)
+    return jsonify({
+        'ticker': ticker,
+        'funds': [{'name': name, 'weight': weight} for name, weight in holders],
+        'total_funds': index.portfolio_count()
+    })
+
+@app.route('/shock_scenario', methods=['POST'])
+def shock_scenario():
+    """
+    Gövde: {"shocks": {"THYAO": -5, "GARAN": -3}} (yüzde değişim).
+    Şoklanan varlıkları tutan tüm fonların getirisine etkisi (yüzde puan), en çok etkilenenden başlayarak.
+    """
+    data = request.get_json(silent=True)
+    shocks = data.get('shocks') if isinstance(data, dict) else None
+    if not isinstance(shocks, dict) or not shocks:
+        return jsonify({'error': 'Geçersiz istek. "shocks" sözlüğü bekleniyor (ör. {"THYAO": -5}).'}), 400
+    try:
+        shocks = {ticker.strip().upper(): float(change) for ticker, change in shocks.items()}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Şok değerleri sayı olmalı.'}), 400
+
+    index = _lookthrough()
+    impacts = sorted(index.shock(shocks).items(), key=lambda item: abs(item[1]), reverse=True)
+    return jsonify({
+        'shocks': shocks,
+        'funds': [{'name': name, 'impact': impact} for name, impact in impacts],
+        'affected_funds': len(impacts),
+        'total_funds': index.portfolio_count()
+    })
+
 @app.route('/get_portfolio_history/<portfolio_name>', methods=['GET'])
 def get_portfolio_history(portfolio_name):
-    portfolios = load_portfolios()
-    portfolio_data = portfolios.get(portfolio_name)
+    etag = portfolio_store.etag(portfolio_name)
+    if etag is not None and etag in request.if_none_match:
+        return _conditional_json(etag, None)
+
+    portfolio_data = portfolio_store.get(portfolio_name)
     if not portfolio_data or not portfolio_data.get('current'):
         return jsonify({'error': 'Portföy veya geçmişi bulunamadı.'}), 400
     
@@ -416,13 +839,12 @@ def get_portfolio_history(portfolio_name):
             except ValueError:
                 entry['display_timestamp'] = entry['save_timestamp'] 
 
-    return jsonify(portfolio_data)
+    return _conditional_json(etag, lambda: portfolio_data)
 
 
 @app.route('/revert_portfolio/<portfolio_name>', methods=['POST'])
 def revert_portfolio(portfolio_name):
-    portfolios = load_portfolios()
-    portfolio_data = portfolios.get(portfolio_name)
+    portfolio_data = portfolio_store.get(portfolio_name)
     if not portfolio_data or not portfolio_data.get('history'):
         return jsonify({'error': 'Geri alınacak bir önceki versiyon bulunamadı.'}), 400
     
@@ -432,8 +854,13 @@ def revert_portfolio(portfolio_name):
     if 'save_date' in last_history_item: del last_history_item['save_date']
 
     portfolio_data['current'] = last_history_item
-    portfolios[portfolio_name] = portfolio_data
-    save_portfolios(portfolios)
+    try:
+        portfolio_store.save(portfolio_name, portfolio_data, portfolio_version(portfolio_data))
+    except PortfolioConflictError:
+        return jsonify({'error': f'"{portfolio_name}" portföyü başka biri tarafından değiştirildi. Lütfen tekrar deneyin.'}), 409
+    except Exception as e:
+        print(f"Portföy geri alınırken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
     return jsonify({'success': f'"{portfolio_name}" portföyü bir önceki versiyona başarıyla geri alındı.'})
 
 @app.route('/delete_portfolio', methods=['POST'])
@@ -445,14 +872,98 @@ def delete_portfolio():
     portfolio_name_to_delete = data.get('name')
     if not portfolio_name_to_delete: return jsonify({'error': 'Silinecek portföy adı belirtilmedi.'}), 400
     
-    portfolios = load_portfolios()
-    if portfolio_name_to_delete in portfolios:
-        del portfolios[portfolio_name_to_delete]
-        save_portfolios(portfolios) # Bu fonksiyonun içinde zaten try/except var
+    try:
+        deleted = portfolio_store.delete(portfolio_name_to_delete)
+    except PortfolioConflictError:
+        return jsonify({'error': f'"{portfolio_name_to_delete}" portföyü başka biri tarafından değiştirildi. Lütfen tekrar deneyin.'}), 409
+    except Exception as e:
+        print(f"Portföy silinirken hata: {e}")
+        return jsonify({'error': f'Sunucu hatası: {e}'}), 500
+    if deleted:
         return jsonify({'success': f'"{portfolio_name_to_delete}" portföyü başarıyla silindi.'})
     else:
         return jsonify({'error': 'Silinecek portföy bulunamadı.'}), 404
 
+def _held_stocks(positions):
+    """Dinamik ağırlık hesabına giren varlıklar: adedi olan hisseler (satır indeksleri)."""
+    return np.flatnonzero(positions.is_stock & (positions.adets != 0))
+
+def _dynamic_weight_symbols(positions):
+    held = _held_stocks(positions)
+    return positions.symbols[held][~positions.is_cash[held]].tolist()
+
+def _dynamic_weight_return(positions, quotes, quote_error=None):
+    """
+    Adetlerden hesaplanan piyasa değeri ağırlıklarıyla portföy getirisi.
+    quotes en az portföyün hisselerini içeren get_quotes() çıktısıdır; quote_error verilirse
+    tüm fiyatlı varlıklar hatalı sayılır. (sonuç, hata_mesajı) döner.
+    """
+    from market_data import quote_staleness
+    # Nakit benzeri varlıkların değeri adettir, değişimi 0'dır
+    held = _held_stocks(positions)
+    tickers, symbols = positions.tickers[held], positions.symbols[held]
+    adets = positions.adets[held].astype(float)
+    cash = positions.is_cash[held]
+    priced_symbols = symbols[~cash].tolist()
+
+    # Fiyatlar sembol sırasına hizalanır
+    last = np.full(len(held), np.nan)
+    prev_close = np.full(len(held), np.nan)
+    stale_ages = np.full(len(held), np.nan)
+    errors = {}
+    if quote_error is None:
+        frame = quotes.reindex(priced_symbols)
+        last[~cash] = frame['last'].to_numpy(dtype=float)
+        prev_close[~cash] = frame['prev_close'].to_numpy(dtype=float)
+        stale_ages[~cash] = quote_staleness(quotes, priced_symbols)
+        for i in np.flatnonzero(~cash & np.isnan(last)):
+            errors[int(i)] = f"'{tickers[i]}' için fiyat verisi (son fiyat / dünkü kapanış) alınamadı."
+    else:
+        errors = {int(i): str(quote_error) for i in np.flatnonzero(~cash)}
+    for i, message in errors.items():
+        print(f"Fiyat/Info alınamadı ({tickers[i]}): {message}")
+
+    # Hata alınan varlıkların market değeri ve değişimi 0 sayılır
+    failed = np.zeros(len(held), dtype=bool)
+    failed[list(errors)] = True
+    with np.errstate(divide='ignore', invalid='ignore'):
+        market_values = np.where(cash, adets, last * adets)
+        daily_changes = np.where(cash, 0.0, (last - prev_close) / prev_close * 100)
+    market_values[failed] = 0.0
+    daily_changes[failed] = 0.0
+    total_portfolio_value = float(market_values.sum())
+
+    if total_portfolio_value == 0:
+        if not positions.is_stock.any():
+            return None, 'Portföyde hiç hisse senedi yok.'
+        return None, 'Portföy toplam değeri sıfır (Sadece hisseler dikkate alındı). Adetleri veya varlık kodlarını kontrol edin.'
+
+    dynamic_weights = market_values / total_portfolio_value * 100
+    weighted_impacts = dynamic_weights / 100 * daily_changes
+    total_portfolio_change = float(weighted_impacts.sum())
+
+    asset_details = []
+    for i in range(len(held)):
+        if i in errors:
+            asset_details.append({
+                'type': 'stock', 'ticker': tickers[i], 'adet': int(adets[i]), 'market_value': 0,
+                'daily_change_calc': 0, 'error': errors[i],
+                'dynamic_weight': 0.0, 'daily_change': 0.0, 'weighted_impact': 0.0
+            })
+            continue
+        detail = {
+            'type': 'stock',
+            'ticker': tickers[i],
+            'dynamic_weight': float(dynamic_weights[i]),
+            'daily_change': float(daily_changes[i]),
+            'weighted_impact': float(weighted_impacts[i])
+        }
+        if not np.isnan(stale_ages[i]):
+            detail['stale'] = True
+            detail['stale_age'] = int(stale_ages[i])
+        asset_details.append(detail)
+    return {'total_change': total_portfolio_change, 'details': asset_details, **_staleness(asset_details)}, None
+
 # GÜNCELLENDİ: Bu fonksiyon artık SADECE hisse senetleri için dinamik ağırlık hesabı yapar.
 @app.route('/calculate_dynamic_weights', methods=['POST'])
 def calculate_dynamic_weights():
@@ -467,110 +978,54 @@ def calculate_dynamic_weights():
     if not stocks and not funds:
         return jsonify({'error': 'Hesaplanacak veri gönderilmedi.'}), 400
 
-    total_portfolio_value = 0.0
-    asset_market_values = [] # Hem market değeri hem de hesaplanan değişim burada tutulacak
-    
-    # --- BİRİNCİ DÖNGÜ: Fiyatları al, değeri ve DEĞİŞİMİ hesapla ---
-    for stock in stocks:
-        ticker, adet = stock.get('ticker').strip().upper(), int(stock.get('adet') or 0)
-        borsa_tipi = stock.get('borsa_tipi', 'bist')
-        
-        if adet == 0: continue
-        
-        if ticker in ['NAKIT', 'CASH', 'TAHVIL', 'BOND', 'DEVLET TAHVILI']:
-            market_value = float(adet)
-            asset_market_values.append({
-                'type': 'stock', 
-                'ticker': ticker, 
-                'adet': adet, 
-                'market_value': market_value, 
-                'daily_change_calc': 0.0 # Nakit değişimi 0
-            })
-            total_portfolio_value += market_value
-            continue
-            
-        if borsa_tipi == 'bist':
-            yf_ticker = ticker + '.IS'
-        else: # 'yabanci' ise
-            yf_ticker = ticker
-            
-        try:
-            # --- YENİ HESAPLAMA YÖNTEMİ ---
-            t = yf.Ticker(yf_ticker)
-            info = t.info
-
-            # 1. Gerçek "Dünkü Kapanış" fiyatını al
-            prev_close = info.get('previousClose')
-            if prev_close is None:
-                hist_2d = t.history(period="2d")
-                if len(hist_2d) < 2:
-                    raise Exception(f"'{ticker}' için 'previousClose' (dünkü kapanış) verisi alınamadı.")
-                prev_close = hist_2d['Close'].iloc[-2]
-                
-            # 2. En "Son Fiyat"ı al (Anlık veya son kapanış)
-            latest_price = info.get('currentPrice', info.get('regularMarketPrice'))
-            if latest_price is None:
-                hist_1d = t.history(period="1d")
-                if hist_1d.empty:
-                    raise Exception(f"'{ticker}' için son fiyat (latest price) alınamadı.")
-                latest_price = hist_1d['Close'].iloc[-1]
-
-            # 3. Hesaplamaları yap
-            market_value = latest_price * adet
-            daily_change = ((latest_price - prev_close) / prev_close) * 100
-            
-            asset_market_values.append({
-                'type': 'stock', 
-                'ticker': ticker, 
-                'adet': adet, 
-                'market_value': market_value,
-                'daily_change_calc': daily_change # Değişimi burada sakla
-            })
-            total_portfolio_value += market_value
-            # --- YENİ HESAPLAMA SONU ---
+    from market_data import get_quotes
+    positions = PortfolioPositions(stocks, funds)
+    quotes, quote_error = None, None
+    try:
+        # Tüm hisselerin fiyatları tek bir toplu istekle çekilir
+        quotes = get_quotes(_dynamic_weight_symbols(positions))
+    except Exception as e:
+        quote_error = e
 
-        except Exception as e:
-            print(f"Fiyat/Info alınamadı ({ticker}): {e}")
-            # Hata durumunda, market değeri 0, değişim 0 olsun
-            asset_market_values.append({'type': 'stock', 'ticker': ticker, 'adet': adet, 'market_value': 0, 'daily_change_calc': 0, 'error': str(e)})
+    result, error = _dynamic_weight_return(positions, quotes, quote_error)
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(result)
 
-    # --- TEFAS İLE İLGİLİ TÜM BLOK KALDIRILDI ---
-    # (for fund in funds: ... bloğu silindi)
 
-    if total_portfolio_value == 0:
-        if not stocks:
-            return jsonify({'error': 'Portföyde hiç hisse senedi yok.'}), 400
-        return jsonify({'error': 'Portföy toplam değeri sıfır (Sadece hisseler dikkate alındı). Adetleri veya varlık kodlarını kontrol edin.'}), 400
+# --- UYGULAMA AÇILIŞI ---
+# gunicorn 'app:create_app()' ile başlatıldığında her worker trafik almadan önce create_app'i çalıştırır
+# (--preload kullanılmamalı: ısınmada başlatılan arka plan thread'leri fork sonrası worker'a geçmez).
+# WARMUP=1 ise bu sırada portföyler yüklenir ve fon getirileri bir kez hesaplanır (fiyat önbelleği dolar);
+# böylece yeni ya da yeniden başlatılan worker'ın ilk istekleri soğuk önbelleğe düşmez.
+# SHARED_CACHE_PATH verildiyse sonradan açılan worker'lar ısınmayı paylaşılan önbellekten yapar.
+# Açılış adımlarının süreleri /metrics'te 'fon_takip_startup_seconds' olarak sunulur.
+WARMUP = os.environ.get('WARMUP', '0') == '1'
+_startup_seconds = {}
 
-    total_portfolio_change = 0.0
-    asset_details = []
-    
-    # --- İKİNCİ DÖNGÜ: Ağırlıkları ve etkiyi hesapla ---
-    # Bu döngü artık SADECE 'asset_market_values' içindeki hisseler için çalışacak.
-    for asset in asset_market_values:
-        dynamic_weight = (asset['market_value'] / total_portfolio_value) * 100
-        
-        if asset.get('error'):
-            asset_details.append({**asset, 'dynamic_weight': 0.0, 'daily_change': 0.0, 'weighted_impact': 0.0})
-            continue
+metrics.registry.callback(
+    'fon_takip_startup_seconds', 'Worker açılış adımlarının süresi (import / warm_up)', 'gauge',
+    lambda: [({'phase': phase}, seconds) for phase, seconds in _startup_seconds.items()]
+)
 
-        # Değişimi ilk döngüden al
-        daily_change = asset.get('daily_change_calc', 0.0)
-        
-        weighted_impact = (dynamic_weight / 100) * daily_change
-        total_portfolio_change += weighted_impact
-        
-        detail = {
-            'type': asset['type'],
-            'ticker': asset['ticker'],
-            'dynamic_weight': dynamic_weight,
-            'daily_change': daily_change,
-            'weighted_impact': weighted_impact
-        }
-        asset_details.append(detail)
-        
-    return jsonify({'total_change': total_portfolio_change, 'details': asset_details})
+def warm_up():
+    """Portföy deposunu ve fon getirisi sonucunu hazırlar; hata açılışı durdurmaz."""
+    started = time.perf_counter()
+    try:
+        portfolio_store.all()
+        ranking_refresher.get()
+    except Exception as e:
+        print(f"Isınma başarısız, önbellekler ilk isteklerde doldurulacak: {e}")
+    _startup_seconds['warm_up'] = time.perf_counter() - started
+
+def create_app(warm=None):
+    """Uygulamayı döner; warm (varsayılan WARMUP) verilirse önce önbellekleri ısıtır."""
+    if WARMUP if warm is None else warm:
+        warm_up()
+    return app
+
+_startup_seconds['import'] = time.perf_counter() - _import_started
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
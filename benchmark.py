@@ -0,0 +1,268 @@
+"""
+Hesaplama endpoint'leri için benchmark.
+
+portfolios.json yapısında sentetik portföy setleri (10 - 5.000 fon, ortak BIST hisseleri) üretir,
+Flask uygulamasını test client üzerinden çevrimdışı ReplayProvider ile çalıştırır ve her
+senaryo için p50/p95 gecikme, işlem hacmi, upstream çağrı sayısı ve en yüksek bellek
+kullanımını raporlar. Ayrıca yeni bir süreçte uygulama açılışının (import + ısınma) süresini
+ölçer. Sonuçlar sürümler arası karşılaştırma için JSON olarak kaydedilir.
+
+Kullanım:
+    python benchmark.py --sizes 10,100,1000,5000 --requests 50 --latency 0.05 --output bench_results.json
+"""
+import argparse
+import atexit
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+# Uygulama içe aktarılmadan önce çevrimdışı ayarlar yapılır
+_work_dir = tempfile.mkdtemp(prefix='fon_takip_bench_')
+atexit.register(shutil.rmtree, _work_dir, ignore_errors=True)
+os.environ.setdefault('PORTFOLIO_BACKEND', 'sqlite')
+os.environ.setdefault('PORTFOLIO_SQLITE_PATH', os.path.join(_work_dir, 'portfolios.db'))
+os.environ.setdefault('MARKET_DATA_PROVIDER', 'replay')
+
+import app as fon_app  # noqa: E402
+import market_data  # noqa: E402
+from providers import ReplayProvider  # noqa: E402
+from storage import portfolio_version  # noqa: E402
+
+
+REAL_TICKERS = [
+    'THYAO', 'GARAN', 'SISE', 'PETKM', 'EREGL', 'TCELL', 'YKBNK', 'HALKB', 'PGSUS', 'TAVHL',
+    'CCOLA', 'BTCIM', 'BSOKE', 'IEYHO', 'ECILC', 'INVES', 'ECZYT', 'TEHOL', 'TERA', 'GRTHO',
+    'ADESE', 'SMRVA', 'DSTKF', 'PEKGY', 'DMRGD', 'ENSRI', 'HEDEF', 'IZFAS', 'TRHOL', 'TURSG'
+]
+FOREIGN_TICKERS = ['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOGL']
+FUND_TICKERS = ['IIP', 'IMR', 'IST', 'PRE', 'TTE', 'AFT']
+
+
+def ticker_universe(size):
+    """Gerçek BIST kodları + sentetik kodlardan oluşan, popülerliği azalan sırada sembol evreni."""
+    synthetic = [f'SY{i:04d}' for i in range(max(0, size - len(REAL_TICKERS)))]
+    return (REAL_TICKERS + synthetic)[:size]
+
+
+def generate_portfolios(count, universe, seed=42):
+    """portfolios.json yapısında sentetik portföyler; popüler hisseler fonlar arasında sıkça ortaktır."""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, len(universe) + 1)
+    popularity /= popularity.sum()
+    portfolios = []
+
+    for i in range(count):
+        n_stocks = int(rng.integers(5, 31))
+        tickers = rng.choice(universe, size=min(n_stocks, len(universe)), replace=False, p=popularity)
+        weights = rng.dirichlet(np.ones(len(tickers) + 2)) * 100
+        stocks = [
+            {'ticker': str(t), 'weight': f'{w:.2f}', 'adet': str(int(rng.integers(1000, 10_000_000)))}
+            for t, w in zip(tickers, weights)
+        ]
+        if rng.random() < 0.2:
+            stocks.append({'ticker': str(rng.choice(FOREIGN_TICKERS)), 'weight': '2.00',
+                           'adet': str(int(rng.integers(10, 10_000))), 'borsa_tipi': 'yabanci'})
+        stocks.append({'ticker': 'NAKIT', 'weight': f'{weights[-1]:.2f}', 'adet': str(int(rng.integers(1e5, 1e7)))})
+        funds = [{'ticker': str(rng.choice(FUND_TICKERS)), 'weight': f'{weights[-2]:.2f}', 'adet': '1000'}]
+        portfolios.append({'name': f'F{i:05d}', 'stocks': stocks, 'funds': funds})
+    return portfolios
+
+
+def load_into_store(portfolios):
+    """Portföyleri depoya yazar ve bellekteki kopyayı tazeler."""
+    store = fon_app.portfolio_store
+    for name, container in list(store.all().items()):
+        store.backend.delete(name, portfolio_version(container))
+    for p in portfolios:
+        store.backend.upsert(p['name'], {'current': p, 'history': [], 'version': 1}, None)
+    store.invalidate()
+
+
+# Gecikme başına tek sağlayıcı; üretilen sentetik seriler senaryolar arasında yeniden kullanılır
+_providers = {}
+
+
+def reset_market_data(latency):
+    """Her senaryo soğuk önbellekle ve sıfır çağrı sayacıyla başlar."""
+    if latency not in _providers:
+        _providers[latency] = ReplayProvider(latency=latency, end_date=datetime.now().date())
+    replay = _providers[latency]
+    replay.reset_calls()
+    market_data.set_provider(replay)
+
+
+def run_scenario(name, call, requests, latency, warm):
+    """
+    call(i) fonksiyonunu 'requests' kez çalıştırır. warm=False ise her çağrıdan önce fiyat
+    önbellekleri boşaltılır (soğuk yol). Gecikme ölçümünden sonra bellek zirvesi için
+    tracemalloc altında tek bir ek çağrı yapılır.
+    """
+    reset_market_data(latency)
+    if warm:
+        # Ölçümden önce aynı istek dizisiyle önbellekler ısıtılır
+        for i in range(requests):
+            call(i)
+    calls_before = market_data.provider.calls
+
+    durations = []
+    started = time.perf_counter()
+    for i in range(requests):
+        if not warm:
+            market_data.quote_cache.invalidate()
+            market_data.history_cache.invalidate()
+        t0 = time.perf_counter()
+        status = call(i)
+        durations.append(time.perf_counter() - t0)
+        if status >= 500:
+            raise RuntimeError(f'{name}: HTTP {status}')
+    elapsed = time.perf_counter() - started
+    upstream_calls = market_data.provider.calls - calls_before
+
+    tracemalloc.start()
+    call(requests)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations_ms = sorted(d * 1000 for d in durations)
+    return {
+        'requests': requests,
+        'p50_ms': round(statistics.median(durations_ms), 3),
+        # En yakın sıra (nearest-rank) yöntemiyle p95
+        'p95_ms': round(durations_ms[math.ceil(len(durations_ms) * 0.95) - 1], 3),
+        'mean_ms': round(statistics.fmean(durations_ms), 3),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        'upstream_calls': upstream_calls,
+        'upstream_calls_per_request': round(upstream_calls / requests, 3),
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+
+STARTUP_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import app
+app.create_app(warm=True)
+print(json.dumps({'total': time.perf_counter() - started, **app._startup_seconds}))
+'''
+
+
+def bench_startup(runs):
+    """
+    Her ölçümde yeni bir Python süreci açar ve uygulamanın import ve ısınma sürelerini ölçer
+    (gunicorn worker'ının açılışı / yeniden başlatılması). Isınma depodaki son portföy setiyle yapılır.
+    """
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'runs': runs,
+        **{f'{phase}_ms': round(statistics.median(s[phase] for s in samples) * 1000, 1)
+           for phase in ('import', 'warm_up', 'total')}
+    }
+
+
+def bench_size(count, universe, requests, latency):
+    portfolios = generate_portfolios(count, universe)
+    load_into_store(portfolios)
+    client = fon_app.app.test_client()
+    rnd = random.Random(7)
+    samples = [rnd.choice(portfolios) for _ in range(requests + 1)]
+
+    def all_fund_returns(i):
+        # Arka plan döngüsünün yaptığı tam hesaplama + endpoint'in bellekteki sonucu sunması
+        fon_app.ranking_refresher.refresh()
+        return client.get('/get_all_fund_returns').status_code
+
+    def served_fund_returns(i):
+        return client.get('/get_all_fund_returns').status_code
+
+    def calculate(i):
+        p = samples[i]
+        return client.post('/calculate', json={'stocks': p['stocks'], 'funds': p['funds']}).status_code
+
+    def dynamic_weights(i):
+        p = samples[i]
+        return client.post('/calculate_dynamic_weights', json={'stocks': p['stocks'], 'funds': p['funds']}).status_code
+
+    def historical(i):
+        return client.get(f"/calculate_historical/{samples[i]['name']}").status_code
+
+    scenarios = {
+        'compute_all_fund_returns': (all_fund_returns, False),
+        'compute_all_fund_returns_warm': (all_fund_returns, True),
+        'get_all_fund_returns_snapshot': (served_fund_returns, True),
+        'calculate_cold': (calculate, False),
+        'calculate_warm': (calculate, True),
+        'calculate_dynamic_weights_warm': (dynamic_weights, True),
+        'calculate_historical_cold': (historical, False),
+        'calculate_historical_warm': (historical, True),
+    }
+    results = {}
+    # Arka plan yenilemeleri (depo değişikliği ya da periyot) ölçülen isteklerle yarışıp gecikmeyi ve
+    # upstream çağrı sayısını bozmasın diye ölçüm boyunca durdurulur
+    refreshers = (fon_app.ranking_refresher, fon_app.intraday_refresher)
+    for refresher in refreshers:
+        refresher.pause()
+    try:
+        for name, (call, warm) in scenarios.items():
+            # Tam hesaplama senaryoları büyük setlerde pahalı olduğundan daha az tekrarlanır
+            n = max(3, requests // 10) if name.startswith('compute_') else requests
+            results[name] = run_scenario(name, call, n, latency, warm)
+    finally:
+        for refresher in refreshers:
+            refresher.resume()
+    return {'portfolios': count, 'tickers': len(universe), 'scenarios': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fon-Takip hesaplama endpoint benchmark')
+    parser.add_argument('--sizes', default='10,100,1000,5000', help='Portföy sayıları (virgülle)')
+    parser.add_argument('--tickers', type=int, default=400, help='Sembol evreni büyüklüğü')
+    parser.add_argument('--requests', type=int, default=50, help='Senaryo başına istek sayısı')
+    parser.add_argument('--latency', type=float, default=0.0, help='Upstream çağrısı başına yapay gecikme (sn)')
+    parser.add_argument('--startup-runs', type=int, default=5, help='Açılış ölçümü tekrar sayısı (0: ölçme)')
+    parser.add_argument('--output', default='bench_results.json', help='Sonuç JSON dosyası')
+    args = parser.parse_args()
+
+    universe = ticker_universe(args.tickers)
+    report = {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'config': vars(args),
+        'results': []
+    }
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        result = bench_size(size, universe, args.requests, args.latency)
+        report['results'].append(result)
+        print(f"\n{size} portföy:")
+        for name, r in result['scenarios'].items():
+            print(f"  {name:34s} p50={r['p50_ms']:9.2f} ms  p95={r['p95_ms']:9.2f} ms  "
+                  f"{r['throughput_rps']:8.1f} istek/sn  upstream={r['upstream_calls']:4d}  "
+                  f"bellek={r['peak_memory_kb']:9.1f} KB")
+
+    if args.startup_runs:
+        report['startup'] = bench_startup(args.startup_runs)
+        print(f"\nAçılış: import={report['startup']['import_ms']} ms  "
+              f"ısınma={report['startup']['warm_up_ms']} ms  toplam={report['startup']['total_ms']} ms")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSonuçlar kaydedildi: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
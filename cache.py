@@ -0,0 +1,323 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+# Paylaşılan önbellek (SharedCache) ayarları. SHARED_CACHE_PATH verilirse (örn. gunicorn ile birden
+# fazla worker) fiyat önbellekleri ve fon getirisi sonucu bu SQLite dosyası üzerinden paylaşılır.
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH')
+# Bir anahtarı yükleyen sürecin kirası bu süre (sn) içinde bitmezse diğer süreçler yüklemeyi kendileri yapar
+SHARED_CACHE_LEASE_TIMEOUT = float(os.environ.get('SHARED_CACHE_LEASE_TIMEOUT', 30))
+SHARED_CACHE_POLL_INTERVAL = float(os.environ.get('SHARED_CACHE_POLL_INTERVAL', 0.05))
+
+
+class _InflightCall:
+    """Devam eden bir upstream çağrısını bekleyen isteklerin paylaştığı sonuç kutusu."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QuoteCache:
+    """
+    Süreli (TTL) ve boyut sınırlı, thread-safe önbellek.
+    Aynı anahtar için eşzamanlı gelen istekler tek bir yükleme çağrısını paylaşır (single-flight).
+    share() ile bir SharedCache bağlanırsa yerelde olmayan anahtarlar önce paylaşılan önbellekten
+    okunur; yükleme de süreçler arasında tek seferde yapılır.
+    missing_ttl verilirse yüklenemeyen (None) değerler tam süre yerine en fazla bu kadar saklanır.
+    """
+
+    def __init__(self, max_size, ttl_func, missing_ttl=None):
+        self.max_size = max_size
+        self.ttl_func = ttl_func
+        self.missing_ttl = missing_ttl
+        self.shared = None
+        self.namespace = None
+        self._data = OrderedDict()  # anahtar -> (son_geçerlilik, değer)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def share(self, shared, namespace):
+        """Paylaşılan önbelleği bağlar (shared None ise bağlantıyı kaldırır)."""
+        self.shared = shared
+        self.namespace = namespace
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl_func() if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            # En uzun süredir kullanılmayan kayıtları at (LRU)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def set_many(self, items):
+        """Değerleri yazar; paylaşılan önbellek bağlıysa oraya da yazılır."""
+        for key, value in items.items():
+            self.set(key, value)
+        if self.shared is not None and items:
+            self.shared.write(self.namespace, items, self.ttl_func())
+
+    def lookup_many(self, keys):
+        """Önbellekte (yerel ya da paylaşılan) bulunan anahtarların değerleri; yükleme yapılmaz."""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        missing = [key for key in keys if key not in found]
+        if self.shared is not None and missing:
+            now = time.time()
+            for key, (value, expires_at) in self.shared.read(self.namespace, missing).items():
+                if value is not None:
+                    self.set(key, value, expires_at - now)
+                    found[key] = value
+        return found
+
+    def _ttls(self):
+        """(değer süresi, None değer süresi)"""
+        ttl = self.ttl_func()
+        return ttl, ttl if self.missing_ttl is None else min(ttl, self.missing_ttl)
+
+    def _load(self, keys, batch_loader):
+        """{anahtar: (değer, kalan_süre)} — paylaşılan önbellek bağlıysa onun üzerinden yüklenir."""
+        ttl, missing_ttl = self._ttls()
+        if self.shared is None:
+            loaded = batch_loader(keys)
+            return {key: (loaded.get(key), ttl if loaded.get(key) is not None else missing_ttl) for key in keys}
+        now = time.time()
+        loaded = self.shared.load_many(self.namespace, keys, batch_loader, ttl, missing_ttl)
+        return {key: (value, expires_at - now) for key, (value, expires_at) in loaded.items()}
+
+    def get_many(self, keys, batch_loader):
+        """
+        Verilen anahtarların değerlerini döner. Önbellekte olmayanlar tek bir
+        batch_loader(eksik_anahtarlar) -> {anahtar: değer} çağrısıyla yüklenir.
+        Başka bir istek tarafından zaten yüklenmekte olan anahtarlar için o çağrı beklenir.
+        """
+        results, owned, waiting = {}, {}, {}
+        now = time.monotonic()
+
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._data.get(key)
+                if entry is not None and entry[0] > now:
+                    self._data.move_to_end(key)
+                    results[key] = entry[1]
+                    self.hits += 1
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self.hits += 1
+                else:
+                    owned[key] = self._inflight[key] = _InflightCall()
+                    self.misses += 1
+
+        if owned:
+            try:
+                loaded = self._load(list(owned), batch_loader)
+                for key, call in owned.items():
+                    call.value, ttl = loaded.get(key, (None, None))
+                    self.set(key, call.value, ttl)
+                    results[key] = call.value
+            except Exception as e:
+                for call in owned.values():
+                    call.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key, None)
+                for call in owned.values():
+                    call.event.set()
+
+        for key, call in waiting.items():
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            results[key] = call.value
+
+        return results
+
+    def get_or_load(self, key, loader):
+        return self.get_many([key], lambda keys: {key: loader()})[key]
+
+
+class SharedCache:
+    """
+    Aynı makinedeki süreçlerin (gunicorn worker'ları) paylaştığı, SQLite dosyası üzerinde
+    süreli anahtar-değer önbelleği. Değerler pickle ile saklanır; anahtarlar isim alanı ile ayrılır.
+
+    Bir anahtarı aynı anda sadece bir süreç yükler: eksik anahtarlar için önce süreli bir kira (lease)
+    alınır, kirası alınamayan anahtarlar için diğer sürecin yazması beklenir. Kira sahibi süreç
+    lease_timeout içinde yazmazsa bekleyen süreç yüklemeyi kendisi yapar.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, lease_timeout=SHARED_CACHE_LEASE_TIMEOUT, poll_interval=SHARED_CACHE_POLL_INTERVAL):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.loads = 0
+        self.waits = 0
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS leases ('
+                'key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _ids(namespace, keys):
+        return {f'{namespace}|{key!r}': key for key in keys}
+
+    @staticmethod
+    def _chunks(items, size=500):
+        items = list(items)
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def read(self, namespace, keys):
+        """Süresi dolmamış kayıtlar: {anahtar: (değer, son_geçerlilik_epoch)}."""
+        ids = self._ids(namespace, keys)
+        found = {}
+        now = time.time()
+        with self._connect() as conn:
+            for chunk in self._chunks(ids):
+                rows = conn.execute(
+                    f'SELECT key, value, expires_at FROM entries WHERE expires_at > ? '
+                    f'AND key IN ({",".join("?" * len(chunk))})', [now, *chunk]
+                ).fetchall()
+                for key_id, value, expires_at in rows:
+                    found[ids[key_id]] = (pickle.loads(value), expires_at)
+        return found
+
+    def write(self, namespace, items, ttl):
+        """Değerleri yazar ve son geçerlilik zamanını (epoch) döner."""
+        expires_at = time.time() + ttl
+        rows = [(f'{namespace}|{key!r}', pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at)
+                for key, value in items.items()]
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)', rows)
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),))
+        return expires_at
+
+    def _acquire(self, namespace, keys, owner):
+        """Kirası alınabilen anahtarları döner (süresi dolmuş kiralar devralınır)."""
+        ids = self._ids(namespace, keys)
+        now = time.time()
+        owned = []
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM leases WHERE expires_at <= ?', (now,))
+            conn.executemany('INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)',
+                             [(key_id, owner, now + self.lease_timeout) for key_id in ids])
+            for chunk in self._chunks(ids):
+                rows = conn.execute(
+                    f'SELECT key FROM leases WHERE owner = ? AND key IN ({",".join("?" * len(chunk))})',
+                    [owner, *chunk]
+                ).fetchall()
+                owned += [ids[key_id] for key_id, in rows]
+        return owned
+
+    def _release(self, owner):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM leases WHERE owner = ?', (owner,))
+
+    def load_many(self, namespace, keys, loader, ttl, missing_ttl=None):
+        """
+        Anahtarların değerlerini döner: {anahtar: (değer, son_geçerlilik_epoch)}.
+        Paylaşılan önbellekte olmayanlar loader(eksik_anahtarlar) -> {anahtar: değer} ile yüklenir;
+        başka bir sürecin yüklemekte olduğu anahtarlar için o sürecin sonucu beklenir.
+        None değerler missing_ttl (verilmezse ttl) süresince saklanır.
+        """
+        results = {}
+        remaining = list(dict.fromkeys(keys))
+        deadline = time.monotonic() + self.lease_timeout
+        while remaining:
+            results.update(self.read(namespace, remaining))
+            self.hits += sum(1 for key in remaining if key in results)
+            remaining = [key for key in remaining if key not in results]
+            if not remaining:
+                break
+
+            owner = uuid.uuid4().hex
+            owned = self._acquire(namespace, remaining, owner)
+            if owned:
+                try:
+                    # Kira alınmadan hemen önce başka bir süreç yazmış olabilir
+                    fresh = self.read(namespace, owned)
+                    results.update(fresh)
+                    to_load = [key for key in owned if key not in fresh]
+                    if to_load:
+                        results.update(self._load(namespace, to_load, loader, ttl, missing_ttl))
+                finally:
+                    self._release(owner)
+                remaining = [key for key in remaining if key not in results]
+
+            if remaining:
+                if time.monotonic() >= deadline:
+                    # Kira sahibi yanıt vermedi; kalan anahtarlar bu süreçte yüklenir
+                    results.update(self._load(namespace, remaining, loader, ttl, missing_ttl))
+                    break
+                self.waits += 1
+                time.sleep(self.poll_interval)
+        return results
+
+    def _load(self, namespace, keys, loader, ttl, missing_ttl=None):
+        self.loads += len(keys)
+        loaded = loader(keys)
+        values = {key: loaded.get(key) for key in keys}
+        results = {}
+        missing = {key: None for key, value in values.items() if value is None}
+        found = {key: value for key, value in values.items() if value is not None}
+        for items, item_ttl in ((found, ttl), (missing, ttl if missing_ttl is None else missing_ttl)):
+            if items:
+                expires_at = self.write(namespace, items, item_ttl)
+                results.update((key, (value, expires_at)) for key, value in items.items())
+        return results
+
+    def invalidate(self, namespace=None):
+        """İsim alanındaki (namespace None ise tüm) kayıtları siler."""
+        with self._connect() as conn:
+            if namespace is None:
+                conn.execute('DELETE FROM entries')
+            else:
+                conn.execute('DELETE FROM entries WHERE substr(key, 1, ?) = ?', (len(namespace) + 1, namespace + '|'))
+
+
+shared_cache = SharedCache(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else None
@@ -0,0 +1,20 @@
+import os
+
+# gunicorn 'app:create_app()' komutu çalışma dizinindeki bu dosyayı otomatik olarak okur.
+# Ayarlar ortam değişkenleriyle değiştirilebilir.
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# Canlı sıralama akışı (/stream/fund_returns) bağlantıları süresiz açık kalır. Sync worker'da her açık
+# bağlantı bir worker sürecini tamamen meşgul eder; gevent worker'ında ise her bağlantı hafif bir
+# greenlet'tir ve boşta beklerken başka istekleri engellemez.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+# Bu süre boyunca yanıt vermeyen (olay döngüsü bloklanan) worker yeniden başlatılır
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Isınmada başlatılan arka plan thread'leri fork sonrası worker'a geçmediği için uygulama
+# her worker'da ayrı yüklenir (bkz. app.create_app)
+preload_app = False
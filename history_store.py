@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+
+# SQLite dosyasının bellek eşlemeli (mmap) okunacak en büyük boyutu (bayt)
+HISTORY_MMAP_SIZE = int(os.environ.get('HISTORY_MMAP_SIZE', 256 * 1024 * 1024))
+
+
+def _day(value):
+    """Tarih / Timestamp / metin değerini 'YYYY-MM-DD' biçimine çevirir."""
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+class DailyCloseStore:
+    """
+    Sembol bazlı günlük kapanışları yerel bir SQLite dosyasında saklar.
+    Geçmiş kapanışlar değişmediği için her sembolün indirilmiş (kapsanan) tarih aralığı tutulur
+    ve sadece bu aralığın dışında kalan günler indirilir.
+
+    fetch(semboller, başlangıç, bitiş) -> sütunları sembol olan kapanış DataFrame'i
+    """
+
+    def __init__(self, path, fetch):
+        self.path = path
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS daily_closes ('
+                'symbol TEXT NOT NULL, day TEXT NOT NULL, close REAL NOT NULL, '
+                'PRIMARY KEY (symbol, day)) WITHOUT ROWID'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS coverage ('
+                'symbol TEXT PRIMARY KEY, start_day TEXT NOT NULL, end_day TEXT NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(f'PRAGMA mmap_size = {HISTORY_MMAP_SIZE}')
+        return conn
+
+    def _coverage(self, conn, symbols):
+        placeholders = ','.join('?' * len(symbols))
+        rows = conn.execute(
+            f'SELECT symbol, start_day, end_day FROM coverage WHERE symbol IN ({placeholders})', symbols
+        ).fetchall()
+        return {symbol: (start_day, end_day) for symbol, start_day, end_day in rows}
+
+    @staticmethod
+    def _missing_range_list(coverage, start, end):
+        """Kapsanan aralığı [start, end) isteğini içerecek şekilde bitişik olarak genişletmek için gereken aralıklar."""
+        if coverage is None:
+            return [(start, end)]
+        cov_start, cov_end = coverage
+        ranges = []
+        if start < cov_start:
+            ranges.append((start, cov_start))
+        if end > cov_end:
+            ranges.append((cov_end, end))
+        return ranges
+
+    def _fill(self, symbols, start, end):
+        """Eksik aralıkları aynı aralığa ihtiyaç duyan sembollerle birlikte toplu olarak indirir."""
+        with self._connect() as conn:
+            coverage = self._coverage(conn, symbols)
+
+        by_range = {}
+        for symbol in symbols:
+            for missing in self._missing_range_list(coverage.get(symbol), start, end):
+                by_range.setdefault(missing, []).append(symbol)
+
+        for (range_start, range_end), range_symbols in by_range.items():
+            # İş günü içermeyen aralıklar (hafta sonu) için indirme yapılmaz
+            has_business_day = np.busday_count(range_start, range_end) > 0
+            close = self.fetch(range_symbols, range_start, range_end) if has_business_day else pd.DataFrame()
+            # Hiçbir sembol için veri gelmediyse (bağlantı sorunu olabilir) aralık kapsanmış sayılmaz
+            if has_business_day and close.dropna(how='all').empty:
+                continue
+
+            rows = []
+            # Veri gelmeyen semboller (geçici hata olabilir) kapsanmış sayılmaz; sonraki istekte yeniden denenir
+            covered = [] if has_business_day else list(range_symbols)
+            for symbol in range_symbols:
+                if symbol in close.columns:
+                    series = close[symbol].dropna()
+                    if not series.empty:
+                        covered.append(symbol)
+                    rows += [(symbol, _day(ts), float(v)) for ts, v in series.items()]
+
+            with self._connect() as conn:
+                conn.executemany('INSERT OR REPLACE INTO daily_closes (symbol, day, close) VALUES (?, ?, ?)', rows)
+                for symbol in covered:
+                    cov_start, cov_end = coverage.get(symbol, (range_start, range_end))
+                    coverage[symbol] = (min(cov_start, range_start), max(cov_end, range_end))
+                    conn.execute(
+                        'INSERT OR REPLACE INTO coverage (symbol, start_day, end_day) VALUES (?, ?, ?)',
+                        (symbol, *coverage[symbol])
+                    )
+
+    def get_closes(self, symbols, start_date, end_date):
+        """
+        Semboller için [start_date, end_date) aralığındaki günlük kapanışları döner
+        (indeks tarih, sütunlar sembol). Eksik günler önce indirilip dosyaya eklenir.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return pd.DataFrame()
+        start, end = _day(start_date), _day(end_date)
+
+        with self._lock:
+            self._fill(symbols, start, end)
+
+        placeholders = ','.join('?' * len(symbols))
+        with metrics.span('history_store.read'), self._connect() as conn:
+            frame = pd.read_sql_query(
+                f'SELECT symbol, day, close FROM daily_closes '
+                f'WHERE symbol IN ({placeholders}) AND day >= ? AND day < ?',
+                conn, params=[*symbols, start, end]
+            )
+        if frame.empty:
+            return pd.DataFrame()
+        frame['day'] = pd.to_datetime(frame['day'])
+        return frame.pivot(index='day', columns='symbol', values='close').sort_index()
@@ -0,0 +1,118 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class BarRingBuffer:
+    """
+    Tek bir sembolün gün içi bar kapanışlarını sabit kapasiteli halka tamponda tutar.
+    Zaman damgaları UTC epoch saniyesidir. Kapasite dolunca en eski bar silinir; böylece
+    bellek kullanımı gün boyu sabit kalır.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._closes = np.zeros(capacity, dtype=float)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def last_time(self):
+        return int(self._times[(self._start + self._size - 1) % self.capacity]) if self._size else None
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+    def append(self, timestamp, close):
+        """
+        Barı ekler. Son barla aynı zamanlı bar (henüz kapanmamış bar güncellemesi) üzerine yazılır,
+        son bardan eski barlar yok sayılır.
+        """
+        last = self.last_time()
+        if last is not None and timestamp < last:
+            return
+        if last is not None and timestamp == last:
+            self._closes[(self._start + self._size - 1) % self.capacity] = close
+            return
+        end = (self._start + self._size) % self.capacity
+        self._times[end] = timestamp
+        self._closes[end] = close
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+    def arrays(self):
+        """(zamanlar, kapanışlar) — eskiden yeniye sıralı kopyalar."""
+        order = (self._start + np.arange(self._size)) % self.capacity
+        return self._times[order], self._closes[order]
+
+
+class IntradayBarStore:
+    """
+    Sembol -> BarRingBuffer. Her sembol sadece son işlem gününün barlarını tutar;
+    yeni günün ilk barı geldiğinde tampon sıfırlanır.
+    """
+
+    def __init__(self, capacity, tz):
+        self.capacity = capacity
+        self.tz = tz
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _day(self, timestamp):
+        return pd.Timestamp(timestamp, unit='s', tz='UTC').tz_convert(self.tz).date()
+
+    def update(self, bars):
+        """bars: indeksi UTC zaman damgası, sütunları sembol olan kapanış tablosu."""
+        if bars is None or bars.empty:
+            return
+        times = pd.DatetimeIndex(bars.index).as_unit('s').asi8
+        with self._lock:
+            for symbol in bars.columns:
+                closes = bars[symbol].to_numpy(dtype=float)
+                valid = ~np.isnan(closes)
+                if not valid.any():
+                    continue
+                buffer = self._buffers.get(symbol)
+                if buffer is None:
+                    buffer = self._buffers[symbol] = BarRingBuffer(self.capacity)
+                last = buffer.last_time()
+                if last is not None and self._day(times[valid][-1]) != self._day(last):
+                    buffer.clear()
+                for timestamp, close in zip(times[valid], closes[valid]):
+                    buffer.append(int(timestamp), float(close))
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+
+    def has(self, symbol):
+        with self._lock:
+            return symbol in self._buffers and len(self._buffers[symbol]) > 0
+
+    def prices(self, symbols):
+        """
+        Semboller için ortak zaman eksenine hizalanmış, ileri doldurulmuş fiyat tablosu
+        (indeks UTC zaman damgası). Sadece en güncel işlem gününün barları kullanılır.
+        """
+        columns = {}
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                buffer = self._buffers.get(symbol)
+                if buffer is not None and len(buffer):
+                    times, closes = buffer.arrays()
+                    columns[symbol] = pd.Series(closes, index=pd.to_datetime(times, unit='s', utc=True))
+        if not columns:
+            return pd.DataFrame()
+        latest_day = max(self._day(s.index[-1].value // 10 ** 9) for s in columns.values())
+        columns = {
+            symbol: s for symbol, s in columns.items()
+            if self._day(s.index[-1].value // 10 ** 9) == latest_day
+        }
+        return pd.concat(columns, axis=1).sort_index().ffill()
@@ -0,0 +1,86 @@
+import threading
+
+
+class LookthroughIndex:
+    """
+    Varlık kodundan, onu tutan portföylere ters indeks: ticker -> {portföy: yüzde ağırlık}.
+    Depo değişiklikleri mark_changed ile bildirilir ve bir sonraki sync'te sadece değişen
+    portföylerin satırları güncellenir; tam yeniden kurulum sadece depo baştan yüklendiğinde yapılır.
+    Aynı varlık bir portföyde birden fazla satırda geçiyorsa ağırlıkları toplanır.
+    """
+
+    def __init__(self):
+        self._holders = {}     # ticker -> {portföy: ağırlık}
+        self._holdings = {}    # portföy -> {ticker: ağırlık}
+        self._pending = set()
+        self._stale = True
+        # sync içinde depo okunurken depo değişiklik bildirimi (mark_changed) aynı thread'den gelebilir
+        self._lock = threading.RLock()
+
+    def mark_changed(self, name=None):
+        """Portföy değişikliği bildirimi (name None ise tüm indeks yeniden kurulur)."""
+        with self._lock:
+            if name is None:
+                self._stale = True
+            else:
+                self._pending.add(name)
+
+    def sync(self, get_portfolios, positions_of):
+        """
+        Bekleyen değişiklikleri uygular.
+        get_portfolios() -> depodaki {isim: kayıt} sözlüğü; positions_of(isim, kayıt) -> PortfolioPositions
+        Depo kilit altında okunur: okumadan sonra gelen bildirimler bir sonraki sync'e kalır, böylece
+        bekleyen bir değişiklik eski sözlüğe göre uygulanıp silinmez.
+        """
+        with self._lock:
+            portfolios = get_portfolios()
+            if self._stale:
+                self._holders, self._holdings = {}, {}
+                names = list(portfolios)
+                # Depo yüklenemediyse (boş) bir sonraki sorguda tekrar denenir
+                self._stale = not portfolios
+                self._pending.clear()
+            else:
+                names, self._pending = self._pending, set()
+            for name in names:
+                container = portfolios.get(name)
+                self._set(name, positions_of(name, container) if container and container.get('current') else None)
+
+    def _set(self, name, positions):
+        for ticker in self._holdings.pop(name, {}):
+            holders = self._holders.get(ticker)
+            if holders is not None:
+                holders.pop(name, None)
+                if not holders:
+                    del self._holders[ticker]
+        if positions is None:
+            return
+
+        holdings = {}
+        for ticker, weight in zip(positions.tickers.tolist(), positions.weights.tolist()):
+            if weight != 0:
+                holdings[ticker] = holdings.get(ticker, 0.0) + weight
+        self._holdings[name] = holdings
+        for ticker, weight in holdings.items():
+            self._holders.setdefault(ticker, {})[name] = weight
+
+    def holders(self, ticker):
+        """{portföy: yüzde ağırlık} — varlığı tutan portföyler."""
+        with self._lock:
+            return dict(self._holders.get(ticker, {}))
+
+    def portfolio_count(self):
+        with self._lock:
+            return len(self._holdings)
+
+    def shock(self, shocks):
+        """
+        shocks: {ticker: yüzde değişim}. Her portföyün getirisine etkisini (yüzde puan) döner;
+        sadece şoklanan varlıklardan en az birini tutan portföyler sonuçta yer alır.
+        """
+        impacts = {}
+        with self._lock:
+            for ticker, change in shocks.items():
+                for name, weight in self._holders.get(ticker, {}).items():
+                    impacts[name] = impacts.get(name, 0.0) + weight / 100 * change
+        return impacts
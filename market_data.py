@@ -0,0 +1,319 @@
+import atexit
+import os
+import tempfile
+import time
+from datetime import datetime, time as dt_time
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from cache import QuoteCache, shared_cache
+from history_store import DailyCloseStore
+from intraday import IntradayBarStore
+from providers import YahooProvider, ReplayProvider
+from upstream import CircuitBreaker, CircuitOpenError, EmptyUpstreamResponse
+
+
+# --- ÖNBELLEK AYARLARI ---
+# Süreler saniye cinsindendir; ortam değişkenleriyle değiştirilebilir.
+QUOTE_TTL_MARKET_OPEN = float(os.environ.get('QUOTE_TTL_MARKET_OPEN', 60))
+QUOTE_TTL_MARKET_CLOSED = float(os.environ.get('QUOTE_TTL_MARKET_CLOSED', 1800))
+# Veri gelmeyen semboller (geçici upstream hatası olabilir) sadece bu kadar süre önbellekte tutulur
+QUOTE_TTL_MISSING = float(os.environ.get('QUOTE_TTL_MISSING', 60))
+QUOTE_CACHE_SIZE = int(os.environ.get('QUOTE_CACHE_SIZE', 2000))
+HISTORY_CACHE_SIZE = int(os.environ.get('HISTORY_CACHE_SIZE', 2000))
+# Günlük kapanışların kalıcı olarak saklandığı yerel SQLite dosyası
+PRICE_HISTORY_DB = os.environ.get('PRICE_HISTORY_DB', 'price_history.db')
+# Tek bir yf.download çağrısında istenecek en fazla sembol sayısı
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 100))
+
+# --- UPSTREAM (YAHOO) İSTEK AYARLARI ---
+FETCH_MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', 16))
+FETCH_PER_HOST_LIMIT = int(os.environ.get('FETCH_PER_HOST_LIMIT', 8))
+FETCH_TIMEOUT = float(os.environ.get('FETCH_TIMEOUT', 10))
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', 2))
+FETCH_BACKOFF = float(os.environ.get('FETCH_BACKOFF', 0.5))
+
+# --- DEVRE KESİCİ ---
+# Art arda BREAKER_FAILURE_THRESHOLD upstream hatasından sonra upstream çağrıları durdurulur;
+# arka planda her BREAKER_RESET_TIMEOUT saniyede bir BREAKER_PROBE_SYMBOL çekilerek erişim denenir.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', 30))
+BREAKER_PROBE_SYMBOL = os.environ.get('BREAKER_PROBE_SYMBOL', 'XU100.IS')
+# Tamamen boş gelen toplu çağrı ancak bu kadar sembol içeriyorsa (ya da bilinen bir sembol varsa) hata sayılır
+BREAKER_MIN_EMPTY_BATCH = int(os.environ.get('BREAKER_MIN_EMPTY_BATCH', 10))
+
+ISTANBUL_TZ = ZoneInfo('Europe/Istanbul')
+BIST_OPEN, BIST_CLOSE = dt_time(9, 55), dt_time(18, 15)
+
+# --- GÜN İÇİ BAR AYARLARI ---
+# INTRADAY_INTERVAL: '1m' veya '5m'. Tampon kapasitesi varsayılan olarak tam bir seansı alacak kadardır.
+INTRADAY_INTERVAL = os.environ.get('INTRADAY_INTERVAL', '5m')
+INTRADAY_BUFFER_SIZE = int(os.environ.get('INTRADAY_BUFFER_SIZE', 0)) or (8 * 60 + 20) // int(INTRADAY_INTERVAL.rstrip('m')) + 1
+
+
+def is_market_open(now=None):
+    """BIST seansının (hafta içi 09:55 - 18:15, İstanbul saati) açık olup olmadığını döner."""
+    now = now or datetime.now(ISTANBUL_TZ)
+    if now.weekday() >= 5:
+        return False
+    return BIST_OPEN <= now.time() <= BIST_CLOSE
+
+
+def current_quote_ttl():
+    """Seans içindeyken kısa, seans dışında uzun önbellek süresi kullanılır."""
+    return QUOTE_TTL_MARKET_OPEN if is_market_open() else QUOTE_TTL_MARKET_CLOSED
+
+
+# Süreç genelinde paylaşılan önbellekler (Yahoo sembolü bazlı)
+quote_cache = QuoteCache(QUOTE_CACHE_SIZE, current_quote_ttl, QUOTE_TTL_MISSING)
+history_cache = QuoteCache(HISTORY_CACHE_SIZE, current_quote_ttl, QUOTE_TTL_MISSING)
+# Upstream erişilemezken sunulan son başarılı fiyatlar (süresiz, sadece boyut sınırlı)
+last_good_quotes = QuoteCache(QUOTE_CACHE_SIZE, lambda: float('inf'))
+
+
+# Sembol başına sınırlı halka tamponda tutulan gün içi barlar
+intraday_store = IntradayBarStore(INTRADAY_BUFFER_SIZE, ISTANBUL_TZ)
+
+
+# --- VERİ SAĞLAYICI ---
+# MARKET_DATA_PROVIDER: 'yahoo' (varsayılan) veya 'replay' (çevrimdışı; REPLAY_DATA_DIR, REPLAY_LATENCY)
+
+def create_provider_from_env():
+    if os.environ.get('MARKET_DATA_PROVIDER', 'yahoo') == 'replay':
+        return ReplayProvider(
+            data_dir=os.environ.get('REPLAY_DATA_DIR'),
+            latency=float(os.environ.get('REPLAY_LATENCY', 0)),
+            end_date=os.environ.get('REPLAY_END_DATE')
+        )
+    return YahooProvider(BATCH_CHUNK_SIZE, FETCH_MAX_WORKERS, FETCH_PER_HOST_LIMIT,
+                         FETCH_TIMEOUT, FETCH_RETRIES, FETCH_BACKOFF)
+
+
+# Yahoo dışındaki sağlayıcıların verisi kalıcı kapanış dosyasına karışmasın diye geçici dosya kullanılır.
+# Süreçte aynı anda tek geçici dosya bulunur: sağlayıcı değişince ve süreç kapanırken silinir.
+_temp_history_db = None
+
+
+def _remove_temp_history_db():
+    global _temp_history_db
+    if _temp_history_db is None:
+        return
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        try:
+            os.remove(_temp_history_db + suffix)
+        except FileNotFoundError:
+            pass
+    _temp_history_db = None
+
+
+atexit.register(_remove_temp_history_db)
+
+
+def _history_db_path(provider):
+    global _temp_history_db
+    _remove_temp_history_db()
+    if provider.name == 'yahoo':
+        return PRICE_HISTORY_DB
+    fd, _temp_history_db = tempfile.mkstemp(prefix=f'fon_takip_{provider.name}_', suffix='.db')
+    os.close(fd)
+    return _temp_history_db
+
+
+def _fetch_daily_closes(symbols, start, end):
+    # Devre açıkken boş sonuç döner; kapanış deposu eldeki günlerle yanıt verir
+    if breaker.is_open:
+        return pd.DataFrame()
+    with metrics.span('upstream.daily_closes'):
+        return breaker.call(provider.fetch_daily_closes, symbols, start, end)
+
+
+def _no_quotes(quotes):
+    """
+    yfinance ağ ve istek sınırı hatalarını çoğu zaman istisna yerine boş veri olarak döndürür;
+    hiçbir sembol için fiyat gelmeyen toplu çağrı devre kesici için upstream hatası sayılır.
+    """
+    return bool(quotes) and all(q is None for q in quotes.values())
+
+
+def _upstream_down(quotes):
+    """
+    Boş toplu çağrının devre kesici için hata sayılıp sayılmayacağı. Yanlış yazılmış tek bir
+    sembol de boş döner; bu yüzden boş sonuç, ancak çağrıda daha önce fiyatı alınabilmiş
+    (ya da yoklama) sembolü varsa veya çağrı yeterince büyükse upstream hatası kabul edilir.
+    """
+    if not _no_quotes(quotes):
+        return False
+    if len(quotes) >= BREAKER_MIN_EMPTY_BATCH or BREAKER_PROBE_SYMBOL in quotes:
+        return True
+    return bool(last_good_quotes.lookup_many(list(quotes)))
+
+
+def _probe_quotes(provider):
+    if _no_quotes(provider.fetch_quotes([BREAKER_PROBE_SYMBOL])):
+        raise EmptyUpstreamResponse(f'Veri alınamadı: {BREAKER_PROBE_SYMBOL}')
+
+
+def _fetch_quotes(symbols):
+    with metrics.span('upstream.quotes'):
+        quotes = breaker.call(provider.fetch_quotes, symbols, is_failure=_upstream_down)
+    fetched_at = time.time()
+    quotes = {s: {**q, 'fetched_at': fetched_at} if q else None for s, q in quotes.items()}
+    last_good_quotes.set_many({s: q for s, q in quotes.items() if q is not None})
+    return quotes
+
+
+def set_provider(new_provider):
+    """
+    Aktif veri sağlayıcısını değiştirir (örn. test ve benchmark için ReplayProvider).
+    Önceki sağlayıcının verileri karışmasın diye önbellekler temizlenir.
+    """
+    global provider, close_store, breaker
+    provider = new_provider
+    if breaker is not None:
+        breaker.close()
+    breaker = CircuitBreaker(
+        new_provider.name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT,
+        lambda: _probe_quotes(new_provider)
+    )
+    # Geçmiş kapanışlar diskte tutulur; her sembol için sadece eksik günler indirilir
+    close_store = DailyCloseStore(_history_db_path(new_provider), _fetch_daily_closes)
+    # Süreçler arası paylaşılan önbellekte sağlayıcılar ayrı isim alanları kullanır
+    for name, cache in (('quote', quote_cache), ('history', history_cache), ('last_good_quote', last_good_quotes)):
+        cache.share(shared_cache, f'{new_provider.name}:{name}')
+    quote_cache.invalidate()
+    history_cache.invalidate()
+    last_good_quotes.invalidate()
+    intraday_store.clear()
+
+
+provider = None
+close_store = None
+breaker = None
+set_provider(create_provider_from_env())
+
+
+# --- METRİKLER ---
+
+_CACHES = {'quote': quote_cache, 'history': history_cache}
+
+metrics.registry.callback(
+    'fon_takip_cache_lookups_total', 'Fiyat önbelleği sorguları (hit / miss)', 'counter',
+    lambda: [({'cache': name, 'result': 'hit'}, c.hits) for name, c in _CACHES.items()]
+            + [({'cache': name, 'result': 'miss'}, c.misses) for name, c in _CACHES.items()]
+)
+metrics.registry.callback(
+    'fon_takip_cache_entries', 'Önbellekteki kayıt sayısı', 'gauge',
+    lambda: [({'cache': name}, len(c._data)) for name, c in _CACHES.items()]
+)
+if shared_cache is not None:
+    metrics.registry.callback(
+        'fon_takip_shared_cache_total',
+        'Süreçler arası paylaşılan önbellek: okunan (hit) ve yüklenen (load) anahtarlar, başka süreci bekleme turları (wait)',
+        'counter',
+        lambda: [({'result': 'hit'}, shared_cache.hits), ({'result': 'load'}, shared_cache.loads),
+                 ({'result': 'wait'}, shared_cache.waits)]
+    )
+metrics.registry.callback(
+    'fon_takip_circuit_open', 'Upstream devre kesicisi açık mı (1 / 0)', 'gauge',
+    lambda: [({'provider': provider.name}, int(breaker.is_open))]
+)
+metrics.registry.callback(
+    'fon_takip_upstream_calls_total', 'Aktif veri sağlayıcısına yapılan upstream çağrı sayısı', 'counter',
+    lambda: [({'provider': provider.name}, provider.calls)]
+)
+
+
+# --- FİYAT ÇEKME ---
+
+QUOTE_COLUMNS = ['last', 'prev_close', 'fetched_at', 'stale']
+
+
+def get_quotes(yf_symbols):
+    """
+    Sembollerin son fiyat ve önceki kapanışlarını önbellek üzerinden toplu olarak döner.
+    Sonuç, indeksi Yahoo sembolü olan ['last', 'prev_close', 'fetched_at', 'stale'] sütunlu bir
+    DataFrame'dir; verisi bulunamayan sembollerin satırları NaN olur.
+
+    Upstream hata verirse (veya devre kesici açıksa) ya da bir sembol için veri gelmezse, o sembolün
+    son başarılı fiyatı 'stale' = 1 olarak sunulur; 'fetched_at' fiyatın alındığı andır (epoch sn).
+    Hiçbir sembol için eski fiyat da yoksa upstream hatası yukarı iletilir.
+    """
+    symbols = list(dict.fromkeys(yf_symbols))
+    if not symbols:
+        return pd.DataFrame(columns=QUOTE_COLUMNS, dtype=float)
+    try:
+        quotes = quote_cache.get_many(symbols, _fetch_quotes)
+        error = None
+    except Exception as e:
+        quotes, error = {}, e
+
+    found = {}
+    for symbol in symbols:
+        quote = quotes.get(symbol)
+        if quote is not None:
+            found[symbol] = {**quote, 'stale': 0.0}
+    missing = [symbol for symbol in symbols if symbol not in found]
+    if missing:
+        for symbol, fallback in last_good_quotes.lookup_many(missing).items():
+            found[symbol] = {**fallback, 'stale': 1.0}
+    if error is not None:
+        if not found:
+            raise error
+        if not isinstance(error, CircuitOpenError):
+            print(f"Fiyatlar alınamadı, son bilinen fiyatlar kullanılıyor: {error}")
+
+    frame = pd.DataFrame.from_dict(found, orient='index', columns=QUOTE_COLUMNS, dtype=float)
+    return frame.reindex(symbols)
+
+
+def quote_staleness(quotes, symbols):
+    """
+    get_quotes çıktısından, verilen sembol sırasıyla eski fiyatların yaşını (saniye) döner;
+    taze ya da hiç fiyatı olmayan semboller NaN olur.
+    """
+    frame = quotes.reindex(symbols)
+    ages = time.time() - frame['fetched_at'].to_numpy(dtype=float)
+    return np.where(frame['stale'].to_numpy(dtype=float) == 1, ages, np.nan)
+
+
+def get_close_history(yf_symbols, start_date, end_date):
+    """
+    Semboller için [start_date, end_date) aralığındaki günlük kapanışları döner.
+    Veriler yerel kapanış deposundan okunur; depoda olmayan günler tek bir toplu istekle tamamlanır.
+    """
+    def load(keys):
+        close = close_store.get_closes([k[0] for k in keys], start_date, end_date)
+        loaded = {}
+        for key in keys:
+            series = close[key[0]].dropna() if key[0] in close.columns else None
+            # Verisi olmayan semboller None olarak, kısa süreyle önbelleğe alınır
+            loaded[key] = series if series is not None and not series.empty else None
+        return loaded
+
+    keys = [(s, start_date, end_date) for s in yf_symbols]
+    series = history_cache.get_many(keys, load)
+    columns = {key[0]: s for key, s in series.items() if s is not None and not s.empty}
+    if not columns:
+        return pd.DataFrame()
+    return pd.concat(columns, axis=1)
+
+
+def get_intraday_prices(yf_symbols):
+    """
+    Sembollerin gün içi fiyat tablosunu (indeks UTC zaman damgası, sütunlar sembol) döner.
+    Barlar seans içindeyken her çağrıda tek bir toplu istekle tazelenir; seans dışında sadece
+    tamponu boş olan semboller için indirilir. Tamponlar sembol başına sabit kapasitelidir.
+    """
+    symbols = list(dict.fromkeys(yf_symbols))
+    if not symbols:
+        return pd.DataFrame()
+    missing = symbols if is_market_open() else [s for s in symbols if not intraday_store.has(s)]
+    # Devre açıkken tamponda olan barlarla yanıt verilir
+    if missing and not breaker.is_open:
+        with metrics.span('upstream.intraday_bars'):
+            bars = breaker.call(provider.fetch_intraday_bars, missing, INTRADAY_INTERVAL)
+        intraday_store.update(bars)
+    return intraday_store.prices(symbols)
@@ -0,0 +1,190 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Saniye cinsinden histogram kovaları (1 ms - 30 sn)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Etiket bazlı, sadece artan sayaç."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((n, labels[n]) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Etiket bazlı, sabit kovalı süre histogramı (Prometheus histogram biçiminde)."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # etiketler -> [kova_sayıları, toplam, adet]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((n, labels[n]) for n in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(key, list(s[0]), s[1], s[2]) for key, s in sorted(self._series.items())]
+        result = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                result.append((f'{self.name}_bucket', key + (('le', _format_value(float(bound))),), cumulative))
+            result.append((f'{self.name}_sum', key, total))
+            result.append((f'{self.name}_count', key, count))
+        return result
+
+
+class CallbackMetric:
+    """Değeri her okumada fn() ile hesaplanan metrik; fn -> [(etiket_sözlüğü, değer)]."""
+
+    def __init__(self, name, help, type, fn):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.fn = fn
+
+    def samples(self):
+        return [(self.name, tuple(sorted(labels.items())), value) for labels, value in self.fn()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label_names=()):
+        return self.register(Counter(name, help, label_names))
+
+    def histogram(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, label_names, buckets))
+
+    def callback(self, name, help, type, fn):
+        return self.register(CallbackMetric(name, help, type, fn))
+
+    def render(self):
+        """Tüm metrikleri Prometheus metin biçiminde (text/plain; version=0.0.4) döner."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"Metrik okunamadı ({metric.name}): {e}")
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+span_seconds = registry.histogram(
+    'fon_takip_span_seconds',
+    'Sıcak yol adımlarının süresi (depolama, upstream, önbellek dolumu, hesaplama)',
+    ('span',)
+)
+
+
+# --- İSTEK BAZLI ÖLÇÜMLER ---
+# Her isteğin kendi adımları Server-Timing başlığı için ayrıca toplanır.
+# Arka plan thread'lerinde (snapshot yenileme, upstream havuzu) istek bağlamı yoktur;
+# bu adımlar sadece histogramlara yazılır.
+
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def start_request():
+    """Bu bağlamdaki adım sürelerini toplamaya başlar."""
+    return _request_spans.set({})
+
+
+def finish_request(token):
+    """Toplanan adım sürelerini {adım: (toplam_sn, adet)} olarak döner ve toplamayı bitirir."""
+    spans = _request_spans.get() or {}
+    _request_spans.reset(token)
+    return spans
+
+
+def record(name, seconds):
+    span_seconds.observe(seconds, span=name)
+    spans = _request_spans.get()
+    if spans is not None:
+        total, count = spans.get(name, (0.0, 0))
+        spans[name] = (total + seconds, count + 1)
+
+
+@contextmanager
+def span(name):
+    """Bloğun süresini 'name' adımı olarak ölçer (hata durumunda da kaydedilir)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def server_timing_header(spans, total=None):
+    """{adım: (toplam_sn, adet)} -> 'storage.load_all;dur=12.3, ...' (milisaniye)."""
+    parts = [f'{name};dur={seconds * 1000:.1f}' for name, (seconds, _) in spans.items()]
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
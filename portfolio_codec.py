@@ -0,0 +1,219 @@
+"""
+Portföy kayıtlarının depolama biçimi.
+
+Bellekte portföyler {'current': {...}, 'history': [...], 'version': n} yapısında tutulur.
+Depoya ise bu yapının sıkıştırılmış, sütunsal bir gösterimi yazılır (PORTFOLIO_FORMAT = 2):
+
+    {
+      "format": 2,
+      "version": n,
+      "s": ["THYAO", "bist", ...],                 # tekil metin tablosu (varlık kodları, borsa tipleri)
+      "current": {
+        "m": {"name": ..., "fonTipi": ...},          # varlık listeleri dışındaki alanlar
+        "stocks": {"t": [0, 3], "w": [12.5, 7.0], "a": [1000, null], "b": [1, 1]},
+        "funds": {...}
+      },
+      "history": [                                  # yeniden eskiye; her kayıt güncel versiyona göre fark
+        {"m": {"save_timestamp": ...}, "d": ["altKategori"], "stocks": [[0, 2], {"r": [5, 3.0, 10, 1]}], ...}
+      ]
+    }
+
+Varlık satırları [kod, ağırlık, adet, borsa_tipi] sütunlarına ayrılır; kod ve borsa tipi metin tablosuna
+indekstir, ağırlık ve adet sayı olarak saklanır. Sayısal metinler sayıya normalleştirilir (bkz. _number);
+bu yüzden çözülen değerler metin değil sayıdır. Bu sütunlara sığmayan (ek alanlı, açıkça None değerli
+ya da sayısal olmayan değerli) satırlar 'x' altında olduğu gibi saklanır. Geçmiş versiyonların listeleri güncel listenin
+satırlarına [başlangıç, adet] aralıklarıyla başvurur; sadece farklı satırlar yeniden yazılır.
+"""
+import json
+
+
+PORTFOLIO_FORMAT = 2
+ASSET_LISTS = ('stocks', 'funds')
+ASSET_FIELDS = ('ticker', 'weight', 'adet', 'borsa_tipi')
+
+
+class _StringTable:
+    def __init__(self, values=()):
+        self.values = list(values)
+        self._index = {v: i for i, v in enumerate(self.values)}
+
+    def add(self, value):
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def _number(value):
+    """
+    Ağırlık / adet değerini sayıya normalleştirir: sayılar ve None olduğu gibi kalır; sayısal metinler
+    tam sayı yazımındaysa int, değilse float olur ("100" -> 100, "12.50" -> 12.5, "1e2" -> 100.0).
+    Metnin yazımı (sondaki sıfırlar, üslü gösterim) korunmaz. Sayı olmayan, NaN ya da sonsuz değerlerde
+    ValueError fırlatılır; bu satırlar olduğu gibi saklanır.
+    """
+    if value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)):
+        return value
+    if isinstance(value, str):
+        number = float(value)
+        if number != number or number in (float('inf'), float('-inf')):
+            raise ValueError(value)
+        return int(number) if number.is_integer() and '.' not in value and 'e' not in value.lower() else number
+    raise ValueError(value)
+
+
+def _encode_row(asset, strings):
+    """Varlığı [kod, ağırlık, adet, borsa_tipi] satırına çevirir; sütunlara sığmıyorsa None."""
+    if not isinstance(asset, dict) or not set(asset) <= set(ASSET_FIELDS):
+        return None
+    # Sütunlarda None 'alan yok' anlamına gelir; açıkça None verilmiş alanlar ancak ham satırda korunur
+    if any(value is None for value in asset.values()):
+        return None
+    ticker, borsa_tipi = asset.get('ticker'), asset.get('borsa_tipi')
+    if not isinstance(ticker, str) or not (borsa_tipi is None or isinstance(borsa_tipi, str)):
+        return None
+    try:
+        weight, adet = _number(asset.get('weight')), _number(asset.get('adet'))
+    except (TypeError, ValueError):
+        return None
+    return [strings.add(ticker), weight, adet, None if borsa_tipi is None else strings.add(borsa_tipi)]
+
+
+def _decode_row(row, strings):
+    ticker, weight, adet, borsa_tipi = row
+    asset = {'ticker': strings[ticker]}
+    if weight is not None:
+        asset['weight'] = weight
+    if adet is not None:
+        asset['adet'] = adet
+    if borsa_tipi is not None:
+        asset['borsa_tipi'] = strings[borsa_tipi]
+    return asset
+
+
+def _encode_block(assets, strings):
+    """Güncel varlık listesini sütunlara ayırır. (blok, satır anahtarları) döner."""
+    block = {'t': [], 'w': [], 'a': [], 'b': []}
+    keys = []
+    for i, asset in enumerate(assets):
+        row = _encode_row(asset, strings)
+        if row is None:
+            block.setdefault('x', {})[str(i)] = asset
+            row = [None, None, None, None]
+            keys.append(json.dumps(asset, sort_keys=True))
+        else:
+            keys.append(json.dumps(row))
+        for column, value in zip('twab', row):
+            block[column].append(value)
+    return block, keys
+
+
+def _decode_block(block, strings):
+    raw = block.get('x', {})
+    assets = []
+    for i, row in enumerate(zip(block['t'], block['w'], block['a'], block['b'])):
+        assets.append(raw[str(i)] if str(i) in raw else _decode_row(row, strings))
+    return assets
+
+
+def _encode_delta(assets, base_keys, strings):
+    """Listeyi, güncel listenin satırlarına [başlangıç, adet] aralıkları ve yeni satırlarla ifade eder."""
+    positions = {}
+    for i, key in enumerate(base_keys):
+        positions.setdefault(key, i)
+    delta = []
+    for asset in assets:
+        row = _encode_row(asset, strings)
+        key = json.dumps(row) if row is not None else json.dumps(asset, sort_keys=True)
+        index = positions.get(key)
+        if index is None:
+            delta.append({'r': row} if row is not None else {'x': asset})
+        elif delta and isinstance(delta[-1], list) and sum(delta[-1]) == index:
+            delta[-1][1] += 1
+        else:
+            delta.append([index, 1])
+    return delta
+
+
+def _decode_delta(delta, base, strings):
+    assets = []
+    for item in delta:
+        if isinstance(item, list):
+            start, count = item
+            assets += [dict(a) for a in base[start:start + count]]
+        elif 'r' in item:
+            assets.append(_decode_row(item['r'], strings))
+        else:
+            assets.append(item['x'])
+    return assets
+
+
+def _meta(version_data):
+    return {k: v for k, v in version_data.items() if k not in ASSET_LISTS}
+
+
+def encode_portfolio(container):
+    """Bellekteki {'current', 'history', 'version'} kaydını depolama biçimine çevirir."""
+    strings = _StringTable()
+    current = container.get('current') or {}
+    encoded_current = {'m': _meta(current)}
+    base_keys = dict.fromkeys(ASSET_LISTS, [])
+    for field in ASSET_LISTS:
+        if field in current:
+            encoded_current[field], base_keys[field] = _encode_block(current[field], strings)
+
+    current_meta = encoded_current['m']
+    history = []
+    for entry in container.get('history', []):
+        meta = _meta(entry)
+        encoded = {
+            'm': {k: v for k, v in meta.items() if current_meta.get(k, object()) != v},
+            'd': [k for k in current_meta if k not in meta],
+        }
+        for field in ASSET_LISTS:
+            if field in entry:
+                encoded[field] = _encode_delta(entry[field], base_keys[field], strings)
+        history.append(encoded)
+
+    data = {'format': PORTFOLIO_FORMAT, 's': strings.values, 'current': encoded_current, 'history': history}
+    if 'version' in container:
+        data['version'] = container['version']
+    return data
+
+
+def _decode_v2(data):
+    strings = data['s']
+    encoded_current = data['current']
+    current = dict(encoded_current['m'])
+    for field in ASSET_LISTS:
+        if field in encoded_current:
+            current[field] = _decode_block(encoded_current[field], strings)
+
+    history = []
+    for encoded in data.get('history', []):
+        entry = {k: v for k, v in encoded_current['m'].items() if k not in encoded.get('d', [])}
+        entry.update(encoded.get('m', {}))
+        for field in ASSET_LISTS:
+            if field in encoded:
+                entry[field] = _decode_delta(encoded[field], current.get(field, []), strings)
+        history.append(entry)
+
+    container = {'current': current, 'history': history}
+    if 'version' in data:
+        container['version'] = data['version']
+    return container
+
+
+DECODERS = {2: _decode_v2}
+
+
+def is_encoded(data):
+    return isinstance(data, dict) and 'format' in data
+
+
+def decode_portfolio(data):
+    """Depolama biçimindeki kaydı {'current', 'history', 'version'} yapısına çevirir."""
+    decoder = DECODERS.get(data.get('format'))
+    if decoder is None:
+        raise ValueError(f"Desteklenmeyen portföy biçimi: {data.get('format')}")
+    return decoder(data)
@@ -0,0 +1,173 @@
+import numpy as np
+
+from positions import PortfolioPositions
+
+
+class PortfolioReturnEngine:
+    """
+    Portföy × sembol ağırlık matrisini seyrek (COO) biçimde tutar ve tüm portföylerin
+    günlük getirisini tek bir matris-vektör çarpımıyla hesaplar.
+    Nakit benzeri varlıklar matrise girmez (getirileri 0'dır), sadece detay listesinde görünür.
+    """
+
+    def __init__(self, portfolios):
+        """portfolios: {isim: PortfolioPositions}"""
+        self.names = list(portfolios)
+        self.symbols = []
+        self._index = {name: i for i, name in enumerate(self.names)}
+        symbol_index = {}
+        rows, cols, weights = [], [], []
+        self._assets = []  # Her portföy için (asset_type, ticker, weight, sütun | None) listesi
+
+        for row, positions in enumerate(portfolios.values()):
+            assets = []
+            columns = zip(positions.types.tolist(), positions.tickers.tolist(),
+                          positions.weights.tolist(), positions.symbols.tolist())
+            for asset_type, ticker, weight, symbol in columns:
+                # Ağırlığı 0 olan varlıklar getiriye katkı yapmaz
+                if weight == 0:
+                    continue
+                if symbol is None:
+                    assets.append((asset_type, ticker, weight, None))
+                    continue
+                col = symbol_index.get(symbol)
+                if col is None:
+                    col = symbol_index[symbol] = len(self.symbols)
+                    self.symbols.append(symbol)
+                rows.append(row)
+                cols.append(col)
+                weights.append(weight / 100)
+                assets.append((asset_type, ticker, weight, col))
+            self._assets.append(assets)
+
+        self._rows = np.array(rows, dtype=np.int64)
+        self._cols = np.array(cols, dtype=np.int64)
+        self._weights = np.array(weights, dtype=float)
+
+    @classmethod
+    def from_portfolios(cls, portfolios, positions_cache=None):
+        """
+        Depodaki kayıtlardan ({isim: {'current', 'history', 'version'}}) motoru kurar.
+        positions_cache verilirse portföy pozisyonları versiyon bazlı önbellekten okunur.
+        """
+        return cls({
+            name: positions_cache.get(name, container) if positions_cache else PortfolioPositions.from_container(container)
+            for name, container in portfolios.items()
+            if container.get('current')
+        })
+
+    @classmethod
+    def from_assets(cls, stocks, funds):
+        """İstekle gelen tek bir hisse/fon listesinden (isimsiz) motoru kurar."""
+        return cls({None: PortfolioPositions(stocks, funds)})
+
+    def price_changes(self, quotes):
+        """
+        get_quotes() çıktısından self.symbols sırasıyla yüzde günlük değişim vektörünü üretir.
+        Verisi olmayan semboller NaN olur.
+        """
+        frame = quotes.reindex(self.symbols)
+        last = frame['last'].to_numpy(dtype=float)
+        prev_close = frame['prev_close'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes = (last - prev_close) / prev_close * 100
+        changes[~np.isfinite(changes)] = np.nan
+        return changes
+
+    def price_change_series(self, prices, quotes):
+        """
+        Gün içi fiyat tablosundan (T × sembol) önceki kapanışa göre yüzde değişim matrisi üretir.
+        Sütunlar self.symbols sırasına getirilir; barı veya önceki kapanışı olmayanlar NaN olur.
+        """
+        last = prices.reindex(columns=self.symbols).to_numpy(dtype=float)
+        prev_close = quotes.reindex(self.symbols)['prev_close'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes = (last - prev_close) / prev_close * 100
+        changes[~np.isfinite(changes)] = np.nan
+        return changes
+
+    def missing_changes(self):
+        """Fiyat alınamadığında kullanılacak, tamamı NaN değişim vektörü."""
+        return np.full(len(self.symbols), np.nan)
+
+    def total_returns(self, changes):
+        """Tüm portföylerin toplam günlük getirisi (self.names sırasıyla); NaN değişimler 0 sayılır."""
+        contributions = self._weights * np.nan_to_num(changes[self._cols])
+        return np.bincount(self._rows, weights=contributions, minlength=len(self.names))
+
+    def total_returns_series(self, changes, chunk_elements=1_000_000):
+        """
+        Zaman serisi versiyonu: changes (T × sembol) değişim matrisinden (T × portföy) getiri matrisi.
+        Zaman adımları, ara matris boyutu chunk_elements'i aşmayacak bloklar halinde
+        tek bir bincount ile hesaplanır; bellek kullanımı portföy sayısından bağımsız sınırlı kalır.
+        """
+        changes = np.nan_to_num(np.atleast_2d(changes))
+        steps, n = changes.shape[0], len(self.names)
+        result = np.zeros((steps, n))
+        if not len(self._cols):
+            return result
+        block = max(1, chunk_elements // len(self._cols))
+        for start in range(0, steps, block):
+            part = changes[start:start + block]
+            contributions = part[:, self._cols] * self._weights
+            offsets = (np.arange(len(part)) * n)[:, None] + self._rows
+            result[start:start + block] = np.bincount(
+                offsets.ravel(), weights=contributions.ravel(), minlength=len(part) * n
+            ).reshape(len(part), n)
+        return result
+
+    def missing_flags(self, changes):
+        """
+        Fiyatlı varlıklarının hiçbiri için değişim hesaplanamayan portföyler (self.names sırasıyla bool dizi).
+        Sadece nakit benzeri varlık içeren portföyler eksik sayılmaz.
+        """
+        priced = np.bincount(self._rows, minlength=len(self.names))
+        missing = np.bincount(self._rows, weights=np.isnan(changes[self._cols]), minlength=len(self.names))
+        return (priced > 0) & (missing == priced)
+
+    def stale_flags(self, stale_ages):
+        """Eski (stale) fiyatlı en az bir varlığı olan portföyler (self.names sırasıyla bool dizi)."""
+        hits = ~np.isnan(stale_ages[self._cols])
+        return np.bincount(self._rows, weights=hits, minlength=len(self.names)) > 0
+
+    def asset_details(self, name, changes, missing_label='Veri Yok', stale_ages=None):
+        """
+        Tek bir portföyün varlık bazlı değişim ve ağırlıklı etkilerini,
+        en çok kazandırandan kaybettirene doğru sıralı olarak döner.
+        stale_ages verilirse eski fiyatla hesaplanan varlıklara 'stale' ve 'stale_age' (sn) eklenir.
+        """
+        details = []
+        for asset_type, ticker, weight, col in self._assets[self._index[name]]:
+            if col is None:
+                details.append({
+                    'type': asset_type,
+                    'ticker': ticker.capitalize(),
+                    'daily_change': 0.0,
+                    'weighted_impact': 0.0
+                })
+                continue
+
+            daily_change = changes[col]
+            if np.isnan(daily_change):
+                details.append({
+                    'type': asset_type,
+                    'ticker': ticker,
+                    'daily_change': 0.0,
+                    'weighted_impact': 0.0,
+                    'error': missing_label
+                })
+                continue
+
+            detail = {
+                'type': asset_type,
+                'ticker': ticker,
+                'daily_change': float(daily_change),
+                'weighted_impact': (weight / 100) * float(daily_change)
+            }
+            if stale_ages is not None and not np.isnan(stale_ages[col]):
+                detail['stale'] = True
+                detail['stale_age'] = int(stale_ages[col])
+            details.append(detail)
+
+        details.sort(key=lambda x: x.get('weighted_impact', 0), reverse=True)
+        return details
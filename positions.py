@@ -0,0 +1,130 @@
+import threading
+from functools import cached_property
+
+import numpy as np
+
+
+# Getirisi 0 kabul edilen nakit benzeri varlıklar
+CASH_TICKERS = ['NAKIT', 'CASH', 'TAHVIL', 'BOND', 'DEVLET TAHVILI', 'TRY', 'TL']
+
+
+def yahoo_symbol(ticker, borsa_tipi='bist'):
+    """BIST varlıklarına '.IS' eki eklenir, 'yabanci' olanlar olduğu gibi kullanılır."""
+    return ticker + '.IS' if borsa_tipi == 'bist' else ticker
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_int(value):
+    try:
+        return int(float(value or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class PortfolioPositions:
+    """
+    Bir portföyün varlık pozisyonlarının sütunsal (numpy) gösterimi. Tüm hesaplama
+    endpoint'leri portföyü bu yapı üzerinden okur; böylece sembol, ağırlık ve adet
+    yorumlaması tek bir yerde yapılır.
+
+    Sütunlar (varlık sırasıyla):
+      types    'stock' / 'fund'
+      tickers  büyük harfli varlık kodu
+      symbols  Yahoo sembolü (nakit benzeri varlıklar için None)
+      weights  yüzde ağırlık (geçersizse 0)
+      adets    adet (geçersizse 0)
+    Kodu boş olan varlıklar atlanır; fonların borsa tipi varsayılan olarak BIST'tir.
+    """
+
+    def __init__(self, stocks, funds):
+        types, tickers, symbols, weights, adets = [], [], [], [], []
+        for asset_type, assets in (('stock', stocks or []), ('fund', funds or [])):
+            for asset in assets:
+                ticker = (asset.get('ticker') or '').strip().upper()
+                if not ticker:
+                    continue
+                types.append(asset_type)
+                tickers.append(ticker)
+                symbols.append(None if ticker in CASH_TICKERS else yahoo_symbol(ticker, asset.get('borsa_tipi', 'bist')))
+                weights.append(_to_float(asset.get('weight', 0)))
+                adets.append(_to_int(asset.get('adet')))
+
+        self.types = np.array(types, dtype=object)
+        self.tickers = np.array(tickers, dtype=object)
+        self.symbols = np.array(symbols, dtype=object)
+        self.weights = np.array(weights, dtype=float)
+        self.adets = np.array(adets, dtype=np.int64)
+        self.is_cash = np.array([s is None for s in symbols], dtype=bool)
+        self.is_stock = self.types == 'stock'
+
+    @classmethod
+    def from_container(cls, container):
+        current = (container or {}).get('current') or {}
+        return cls(current.get('stocks', []), current.get('funds', []))
+
+    def __len__(self):
+        return len(self.tickers)
+
+    @property
+    def _priced_stocks(self):
+        return self.is_stock & ~self.is_cash
+
+    @property
+    def stock_symbols(self):
+        """Fiyatı çekilecek (nakit olmayan) hisse sembolleri, tekrarsız."""
+        return list(dict.fromkeys(self.symbols[self._priced_stocks].tolist()))
+
+    @cached_property
+    def stock_weights(self):
+        """
+        Hisse ağırlıkları (oran) sembol indeksli; aynı sembolün tekrarları toplanır.
+        Sadece tarihsel getiri hesabında gerektiği için ilk kullanımda kurulur; pandas da burada
+        içe aktarılır ki modül, uygulama açılışında pandas yüklemeden kullanılabilsin.
+        """
+        import pandas as pd
+        priced_stocks = self._priced_stocks
+        return (
+            pd.Series(self.weights[priced_stocks] / 100, index=self.symbols[priced_stocks].astype(str))
+            .groupby(level=0, sort=False).sum()
+        )
+
+    def aligned_stock_weights(self, symbols):
+        """Hisse ağırlıklarını verilen sembol sırasına hizalar (indeks birleştirme); olmayanlar 0."""
+        return self.stock_weights.reindex(symbols, fill_value=0.0)
+
+
+class PositionsCache:
+    """
+    Kayıtlı portföylerin PortfolioPositions nesnelerini portföy versiyonuna göre önbellekte tutar.
+    Portföy değişince (versiyon artınca ya da discard çağrılınca) yeniden kurulur.
+    """
+
+    def __init__(self, version_of):
+        self.version_of = version_of
+        self._entries = {}  # isim -> (versiyon, pozisyonlar)
+        self._lock = threading.Lock()
+
+    def get(self, name, container):
+        version = self.version_of(container)
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        positions = PortfolioPositions.from_container(container)
+        with self._lock:
+            self._entries[name] = (version, positions)
+        return positions
+
+    def discard(self, name=None):
+        """Tek portföyün (name None ise tümünün) önbelleğini düşürür."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
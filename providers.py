@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+import zlib
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from upstream import UpstreamExecutor, EmptyUpstreamResponse
+
+
+def quote_from_closes(series):
+    """Kapanış serisinden {'last', 'prev_close'} üretir; en az iki kapanış yoksa None döner."""
+    series = series.dropna() if series is not None else ()
+    if len(series) < 2:
+        return None
+    return {'last': float(series.iloc[-1]), 'prev_close': float(series.iloc[-2])}
+
+
+class MarketDataProvider:
+    """
+    Piyasa verisi sağlayıcılarının ortak arayüzü. Alt sınıflar toplu (batch) işlemleri uygular,
+    tekil işlemler bunların üzerine kuruludur. 'calls' sayacı yapılan upstream çağrı sayısını tutar.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _count_call(self):
+        with self._calls_lock:
+            self.calls += 1
+
+    def reset_calls(self):
+        with self._calls_lock:
+            self.calls = 0
+
+    def fetch_quotes(self, symbols):
+        """{sembol: {'last', 'prev_close'} | None}"""
+        raise NotImplementedError
+
+    def fetch_daily_closes(self, symbols, start_date, end_date):
+        """[start_date, end_date) aralığındaki günlük kapanışlar (indeks tarih, sütunlar sembol)."""
+        raise NotImplementedError
+
+    def fetch_intraday_bars(self, symbols, interval):
+        """Son işlem gününün '1m' / '5m' bar kapanışları (indeks UTC zaman damgası, sütunlar sembol)."""
+        raise NotImplementedError
+
+    def fetch_quote(self, symbol):
+        return self.fetch_quotes([symbol])[symbol]
+
+    def fetch_last_price(self, symbol):
+        quote = self.fetch_quote(symbol)
+        return quote['last'] if quote else None
+
+    def fetch_previous_close(self, symbol):
+        quote = self.fetch_quote(symbol)
+        return quote['prev_close'] if quote else None
+
+    def fetch_daily_close(self, symbol, start_date, end_date):
+        close = self.fetch_daily_closes([symbol], start_date, end_date)
+        return close[symbol] if symbol in close.columns else pd.Series(dtype=float)
+
+
+# --- YAHOO FINANCE ---
+
+def _close_frame(data, symbols):
+    """yf.download çıktısından sütunları Yahoo sembolleri olan kapanış tablosunu çıkarır."""
+    if data is None or data.empty:
+        return pd.DataFrame()
+    close = data['Close']
+    if isinstance(close, pd.Series):
+        close = close.to_frame(symbols[0])
+    return close
+
+
+def _utc_index(frame):
+    """Gün içi tabloların indeksini UTC'ye çevirir (yfinance borsa saat dilimiyle döner)."""
+    index = pd.DatetimeIndex(frame.index)
+    frame.index = index.tz_convert('UTC') if index.tz is not None else index.tz_localize('UTC')
+    return frame
+
+
+def _green_thread():
+    """Süreç gevent ile yamalanmışsa (gunicorn gevent worker'ı) curl_cffi için 'gevent', değilse None."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return None
+    return 'gevent' if monkey.is_module_patched('socket') else None
+
+
+class YahooProvider(MarketDataProvider):
+    """
+    yfinance üzerinden Yahoo Finance verisi. Çağrılar sınırlı bir upstream havuzunda,
+    zaman aşımı ve yeniden deneme ile yapılır; tüm çağrılar tek bir HTTP oturumunu paylaşır.
+    """
+
+    name = 'yahoo'
+    HOST = 'finance.yahoo.com'
+
+    def __init__(self, chunk_size=100, max_workers=16, per_host_limit=8, timeout=10, retries=2, backoff=0.5):
+        super().__init__()
+        self.chunk_size = chunk_size
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.upstream = UpstreamExecutor(max_workers, per_host_limit, timeout, retries, backoff)
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def session(self):
+        """
+        Tüm yfinance çağrılarının paylaştığı bağlantı havuzlu HTTP oturumu (curl_cffi yoksa None).
+        gevent worker'ında oturum gevent kipinde açılır; böylece istekler olay döngüsünü bloklamaz.
+        """
+        with self._session_lock:
+            if self._session is None:
+                try:
+                    from curl_cffi import requests as curl_requests
+                    self._session = curl_requests.Session(impersonate='chrome', thread=_green_thread())
+                except ImportError:
+                    return None
+            return self._session
+
+    def _download(self, symbols, **kwargs):
+        """
+        yf.download çağrısı; soket zaman aşımı ve ortak oturum ile yapılır.
+        Hiç veri gelmezse EmptyUpstreamResponse fırlatılır (yeniden denenmez, boş sonuç sayılır).
+        """
+        import yfinance as yf
+
+        self._count_call()
+        with metrics.span('upstream.yahoo_download'):
+            data = yf.download(symbols, progress=False, threads=False, timeout=self.timeout,
+                               session=self.session(), **kwargs)
+        close = _close_frame(data, symbols)
+        if close.dropna(how='all').empty:
+            raise EmptyUpstreamResponse(f"Veri alınamadı: {', '.join(symbols)}")
+        return close
+
+    def _download_chunked(self, symbols, **kwargs):
+        """
+        Sembolleri parçalara bölüp upstream havuzunda eşzamanlı olarak çeker; (parça, tablo) listesi döner.
+        Parça sayısı host başına eşzamanlılık sınırına göre seçilir. yfinance bir parçadaki sembolleri
+        (threads=False ile) tek tek ve sırayla indirdiğinden, soğuk önbellekte toplam süre yaklaşık
+        ceil(sembol sayısı / per_host_limit) ardışık tek sembollük isteğin süresi kadardır; host başına
+        eşzamanlı istek sayısı per_host_limit'i aşmaz.
+        """
+        chunk_size = min(self.chunk_size, max(1, -(-len(symbols) // self.per_host_limit)))
+        chunks = [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+        results = self.upstream.map(self.HOST, lambda chunk: self._download(chunk, **kwargs),
+                                    [(c,) for c in chunks])
+
+        frames = []
+        for chunk, close in zip(chunks, results):
+            if isinstance(close, EmptyUpstreamResponse):
+                close = pd.DataFrame()
+            elif isinstance(close, Exception):
+                raise close
+            frames.append((chunk, close))
+        return frames
+
+    def fetch_quotes(self, symbols):
+        quotes = {}
+        # Son 5 günün verisini al (Hafta sonu boşluklarını aşmak için)
+        for chunk, close in self._download_chunked(symbols, period="5d"):
+            for symbol in chunk:
+                quotes[symbol] = quote_from_closes(close[symbol] if symbol in close.columns else None)
+        return quotes
+
+    def fetch_daily_closes(self, symbols, start_date, end_date):
+        try:
+            return self.upstream.call(self.HOST, lambda: self._download(symbols, start=start_date, end=end_date))
+        except EmptyUpstreamResponse:
+            return pd.DataFrame()
+
+    def fetch_intraday_bars(self, symbols, interval):
+        frames = [close for _, close in self._download_chunked(symbols, period="1d", interval=interval)
+                  if not close.empty]
+        if not frames:
+            return pd.DataFrame()
+        return _utc_index(pd.concat(frames, axis=1))
+
+
+# --- ÇEVRİMDIŞI TEKRAR OYNATMA ---
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Fiyat serilerini yerel dosyalardan tekrar oynatan, ağ kullanmayan sağlayıcı.
+    data_dir içindeki '<sembol>.csv' dosyaları (Date, Close sütunları) okunur. Dosyası olmayan
+    semboller için (synthetic=True ise) sembol adından türetilen sabit tohumlu bir seri üretilir;
+    böylece aynı gün ve ayarlarla yapılan her çalıştırma aynı fiyatları verir.
+    latency: her upstream çağrısına eklenecek yapay gecikme (saniye).
+    """
+
+    name = 'replay'
+
+    def __init__(self, data_dir=None, latency=0.0, synthetic=True, end_date=None, days=750):
+        super().__init__()
+        self.data_dir = data_dir
+        self.latency = latency
+        self.synthetic = synthetic
+        self.end_date = pd.Timestamp(end_date or date.today())
+        self.days = days
+        # Sentetik serilerin ortak iş günü takvimi; sembol başına yeniden üretilmez
+        self._index = None
+        self._series_cache = {}
+        self._lock = threading.Lock()
+
+    def _load_series(self, symbol):
+        path = os.path.join(self.data_dir, f'{symbol}.csv') if self.data_dir else None
+        if path and os.path.exists(path):
+            frame = pd.read_csv(path, parse_dates=['Date'], index_col='Date')
+            return frame['Close'].sort_index()[:self.end_date]
+        if not self.synthetic:
+            return None
+        rng = np.random.default_rng(zlib.crc32(symbol.encode('utf-8')))
+        if self._index is None:
+            self._index = pd.bdate_range(end=self.end_date, periods=self.days)
+        index = self._index
+        start_price = rng.uniform(5, 500)
+        returns = rng.normal(0.0003, 0.02, len(index))
+        return pd.Series(start_price * np.exp(np.cumsum(returns)), index=index)
+
+    def _series(self, symbol):
+        with self._lock:
+            if symbol not in self._series_cache:
+                self._series_cache[symbol] = self._load_series(symbol)
+            return self._series_cache[symbol]
+
+    def _simulate_call(self):
+        self._count_call()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def fetch_quotes(self, symbols):
+        self._simulate_call()
+        return {symbol: quote_from_closes(self._series(symbol)) for symbol in symbols}
+
+    # Sentetik gün içi barların üretildiği seans (İstanbul saati)
+    SESSION_TZ = 'Europe/Istanbul'
+    SESSION_OPEN, SESSION_CLOSE = '10:00', '18:00'
+
+    def _intraday_series(self, symbol, interval_minutes, now):
+        """
+        Son iki günlük kapanış arasında, sembol ve gün tohumlu bir Brown köprüsü olarak
+        gün içi barlar üretir (son bar günlük kapanışa eşittir). 'now' sonrasındaki barlar atılır.
+        """
+        series = self._series(symbol)
+        if series is None or len(series) < 2:
+            return None
+        prev_close, last = float(series.iloc[-2]), float(series.iloc[-1])
+        day = series.index[-1].strftime('%Y-%m-%d')
+        index = pd.date_range(f'{day} {self.SESSION_OPEN}', f'{day} {self.SESSION_CLOSE}',
+                              freq=f'{interval_minutes}min', tz=self.SESSION_TZ).tz_convert('UTC')
+        rng = np.random.default_rng(zlib.crc32(f'{symbol}:{day}'.encode('utf-8')))
+        steps = np.cumsum(rng.normal(0, 0.002, len(index)))
+        drift = np.linspace(0, 1, len(index))
+        path = steps - drift * steps[-1] + drift * np.log(last / prev_close)
+        bars = pd.Series(prev_close * np.exp(path), index=index)
+        return bars[bars.index <= now]
+
+    def fetch_intraday_bars(self, symbols, interval):
+        self._simulate_call()
+        now = pd.Timestamp.now(tz='UTC')
+        columns = {}
+        for symbol in symbols:
+            bars = self._intraday_series(symbol, int(interval.rstrip('m')), now)
+            if bars is not None and not bars.empty:
+                columns[symbol] = bars
+        return pd.concat(columns, axis=1) if columns else pd.DataFrame()
+
+    def fetch_daily_closes(self, symbols, start_date, end_date):
+        self._simulate_call()
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        columns = {}
+        for symbol in symbols:
+            series = self._series(symbol)
+            if series is not None:
+                window = series[(series.index >= start) & (series.index < end)]
+                if not window.empty:
+                    columns[symbol] = window
+        return pd.concat(columns, axis=1) if columns else pd.DataFrame()
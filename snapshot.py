@@ -0,0 +1,173 @@
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+
+
+class SnapshotRefresher:
+    """
+    Verilen hesaplama fonksiyonunu arka planda sabit aralıklarla çalıştırır ve
+    son sonucu 'computed_at' zaman damgasıyla birlikte bellekte tutar.
+    İstekler hesaplamayı beklemez, her zaman son hazır sonucu okur.
+
+    shared (cache.SharedCache) verilirse sonuç süreçler arasında paylaşılır: shared_key() anahtarlı
+    sonuç 'interval' süresince geçerlidir ve bu sürede sadece bir süreç hesaplama yapar.
+    shared_key, sonucu etkileyen girdileri (örn. portföy versiyonları) temsil etmelidir.
+    """
+
+    def __init__(self, name, compute, interval, shared=None, shared_key=None):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.shared = shared
+        self.shared_key = shared_key or (lambda: None)
+        self._payload = None
+        self._computed_at = None
+        self._lock = threading.Lock()          # Aynı anda tek bir hesaplama
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._paused = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def start(self):
+        """Arka plan thread'ini başlatır (birden fazla çağrılırsa ilk çağrı geçerlidir)."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-refresher', daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        """Hesaplamayı hemen çalıştırır ve sonucu saklar."""
+        with self._lock:
+            if self.shared is None:
+                payload, computed_at = self._compute()
+            else:
+                key = self.shared_key()
+                loaded = self.shared.load_many(self.name, [key], lambda keys: {key: self._compute()}, self.interval)
+                payload, computed_at = loaded[key][0]
+            self._payload = payload
+            self._computed_at = computed_at
+            for callback in self._listeners:
+                try:
+                    callback(payload, self._computed_at)
+                except Exception as e:
+                    print(f"Güncelleme bildirimi başarısız ({self.name}): {e}")
+            return payload, self._computed_at
+
+    def _compute(self):
+        return self.compute(), datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def on_update(self, callback):
+        """Her yeni hesaplamadan sonra callback(payload, computed_at) çağrılır."""
+        self._listeners.append(callback)
+
+    def pause(self):
+        """
+        Arka plan güncellemelerini durdurur (örn. benchmark ölçümü sırasında); devam eden hesaplama
+        varsa bitmesi beklenir. refresh() ve ilk get() çağrıları yine hesaplama yapar.
+        """
+        self._paused.set()
+        with self._lock:
+            pass
+
+    def resume(self):
+        self._paused.clear()
+        self._wakeup.set()
+
+    def request_refresh(self):
+        """Bir sonraki periyodu beklemeden yeniden hesaplama ister (örn. portföy kaydedildiğinde)."""
+        self._wakeup.set()
+
+    def get(self):
+        """
+        (payload, computed_at) döner. Henüz hiç hesaplama yapılmadıysa ilk sonuç
+        bu istek içinde üretilir; arka plan thread'i de bu noktada başlatılır.
+        """
+        self.start()
+        if self._computed_at is None:
+            with self._lock:
+                ready = self._computed_at is not None
+            if not ready:
+                return self.refresh()
+        return self._payload, self._computed_at
+
+    def _run(self):
+        while True:
+            if self._computed_at is not None or self._paused.is_set():
+                self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._paused.is_set():
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Arka plan güncellemesi başarısız ({self.name}): {e}")
+
+
+class DeltaFeed:
+    """
+    Bir kayıt listesinin (örn. fon getirileri) son halini tutar ve her yayında
+    sadece değişen/silinen kayıtları sıra numaralı bir delta olarak saklar.
+    Delta tüm aboneler için bir kez hesaplanır; aboneler ortak bir Condition üzerinde bekler.
+    Sıra numaraları süreç başınadır; olay kimlikleri (event_id) bu yüzden sürece özgü bir 'epoch' içerir.
+    """
+
+    def __init__(self, key_field, max_deltas=100):
+        self.key_field = key_field
+        self.epoch = uuid.uuid4().hex[:12]
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._state = {}
+        self._computed_at = None
+        self._deltas = deque(maxlen=max_deltas)   # (seq, delta)
+
+    def publish(self, records, computed_at):
+        new_state = {r[self.key_field]: r for r in records}
+        changed = [r for key, r in new_state.items() if self._state.get(key) != r]
+        removed = [key for key in self._state if key not in new_state]
+        with self._cond:
+            first = self._seq == 0
+            self._state = new_state
+            self._computed_at = computed_at
+            if changed or removed or first:
+                self._seq += 1
+                self._deltas.append((self._seq, {'changed': changed, 'removed': removed, 'computed_at': computed_at}))
+                self._cond.notify_all()
+
+    def event_id(self, seq):
+        return f'{self.epoch}-{seq}'
+
+    def parse_event_id(self, event_id):
+        """
+        İstemcinin son aldığı olay kimliğinden sıra numarasını döner. Kimlik başka bir sürece
+        (ör. yeniden bağlantı başka worker'a düştüyse) ya da bu sürecin henüz üretmediği bir sıraya
+        aitse None döner; abone tam durumu yeniden almalıdır.
+        """
+        epoch, _, seq = (event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        with self._cond:
+            return int(seq) if int(seq) <= self._seq else None
+
+    def snapshot(self):
+        """(seq, kayıtlar, computed_at) — yeni abonenin başlangıç durumu."""
+        with self._cond:
+            return self._seq, list(self._state.values()), self._computed_at
+
+    def wait(self, after_seq, timeout):
+        """
+        after_seq'ten sonraki deltaları [(seq, delta), ...] olarak döner; timeout içinde yeni delta
+        gelmezse boş liste döner. İstenen deltalar artık tutulmuyorsa None döner (abone tam
+        durumu yeniden almalıdır).
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout=timeout)
+            if self._seq <= after_seq:
+                return []
+            if not self._deltas or self._deltas[0][0] > after_seq + 1:
+                return None
+            return [(seq, delta) for seq, delta in self._deltas if seq > after_seq]
@@ -0,0 +1,550 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from portfolio_codec import decode_portfolio, encode_portfolio, is_encoded
+
+
+def normalize_portfolio_row(name, data):
+    """
+    Veritabanı satırını {'current': ..., 'history': [...]} yapısına çevirir.
+    Sütunsal biçimdeki (portfolio_codec) kayıtlar çözülür; eski yapılar bir sonraki kayıtta
+    sütunsal biçimde yeniden yazılır. Eski yapıdaki (doğrudan 'stocks' içeren) kayıtlar
+    'current' içine taşınır; geçersizler için None döner.
+    """
+    if is_encoded(data):
+        try:
+            return decode_portfolio(data)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"Portföy kaydı çözülemedi, atlanıyor: {name}: {e}")
+            return None
+    if data and data.get('current'):
+        return data
+    if data and 'stocks' in data:
+        print(f"Eski yapı tespit edildi: {name}. 'current' içine taşınıyor...")
+        return {'current': data, 'history': []}
+    print(f"Geçersiz veri yapısı atlanıyor: {name}")
+    return None
+
+
+class PortfolioConflictError(Exception):
+    """Portföy, okunduktan sonra başka bir istek tarafından değiştirilmiş (iyimser kilit çakışması)."""
+
+
+def portfolio_version(container):
+    """Kaydın versiyon numarası; versiyonsuz eski kayıtlar 0 kabul edilir."""
+    return (container or {}).get('version', 0)
+
+
+METADATA_FIELDS = ('fonTipi', 'altKategori', 'yonetim_tipi')
+
+
+def portfolio_metadata(name, container):
+    """Portföy listesinde gösterilen özet bilgi (isim ve kategoriler)."""
+    current_data = (container or {}).get('current') or {}
+    metadata = {'name': current_data.get('name', name)}
+    for field in METADATA_FIELDS:
+        metadata[field] = current_data.get(field)
+    return metadata
+
+
+def content_etag(obj):
+    """JSON'a çevrilebilir bir nesnenin içerik özeti (ETag olarak kullanılır)."""
+    payload = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+# --- DEPOLAMA ARKA UÇLARI ---
+# Her arka uç aşağıdaki işlemleri sunar:
+#   load_all() -> {isim: {'current', 'history', 'version'}}
+#   load_one(isim) -> tek kayıt ya da None
+#   load_metadata() -> [portfolio_metadata(...)] ('data' içeriğinin tamamını çekmeden)
+#   load_versions() -> {isim: versiyon} (diğer süreçlerin yazmalarını fark etmek için hafif sorgu)
+#   upsert(isim, kayıt, beklenen_versiyon) -> sadece o satırı yazar
+#   delete(isim, beklenen_versiyon) -> sadece o satırı siler
+# beklenen_versiyon None ise satırın henüz var olmaması beklenir. Satırdaki versiyon
+# beklenenden farklıysa PortfolioConflictError fırlatılır.
+# Kontrol paneli verileri (örn. takip listeleri) için anahtar-değer işlemleri:
+#   load_settings(önek) -> {anahtar: değer} (anahtarı önekle başlayanlar)
+#   save_setting(anahtar, değer) / delete_setting(anahtar)
+
+class SupabaseBackend:
+    """
+    Supabase 'portfolios' tablosu (name, data) üzerinde çalışır. Versiyon 'data' içinde tutulur.
+    İstemci ilk sorguda client_factory() ile alınır; arka uç oluşturmak bağlantı açmaz.
+    """
+
+    def __init__(self, client_factory):
+        self.client_factory = client_factory
+
+    @property
+    def client(self):
+        return self.client_factory()
+
+    def load_all(self):
+        response = self.client.table('portfolios').select('name, data').execute()
+        portfolios = {}
+        for row in response.data:
+            container = normalize_portfolio_row(row['name'], row.get('data'))
+            if container:
+                portfolios[row['name']] = container
+        return portfolios
+
+    def load_one(self, name):
+        response = self.client.table('portfolios').select('name, data').eq('name', name).maybe_single().execute()
+        if not response or not response.data:
+            return None
+        return normalize_portfolio_row(name, response.data.get('data'))
+
+    def load_metadata(self):
+        # Sadece özet alanlar seçilir; hisse/fon listeleri ve geçmiş versiyonlar aktarılmaz.
+        # Sütunsal biçimde alanlar 'current.m' altında, eski yapılarda 'current' ya da doğrudan 'data' altındadır.
+        paths = {'encoded': 'data->current->m', 'current': 'data->current', 'legacy': 'data'}
+        columns = ['name'] + [
+            f'{prefix}_{field}:{path}->>{field}'
+            for field in ('name',) + METADATA_FIELDS for prefix, path in paths.items()
+        ]
+        response = self.client.table('portfolios').select(', '.join(columns)).execute()
+
+        def first(row, field):
+            return next((row.get(f'{prefix}_{field}') for prefix in paths if row.get(f'{prefix}_{field}')), None)
+
+        return [
+            {
+                'name': first(row, 'name') or row['name'],
+                **{field: first(row, field) for field in METADATA_FIELDS}
+            }
+            for row in response.data
+        ]
+
+    def load_versions(self):
+        response = self.client.table('portfolios').select('name, version:data->>version').execute()
+        return {row['name']: int(row['version'] or 0) for row in response.data}
+
+    def _match_version(self, query, expected_version):
+        if expected_version == 0:
+            return query.is_('data->>version', 'null')
+        return query.eq('data->>version', str(expected_version))
+
+    def upsert(self, name, container, expected_version):
+        table = self.client.table('portfolios')
+        if expected_version is None:
+            try:
+                table.insert({'name': name, 'data': encode_portfolio(container)}).execute()
+            except Exception:
+                if self.load_one(name) is not None:
+                    raise PortfolioConflictError(name)
+                raise
+            return
+
+        query = table.update({'data': encode_portfolio(container)}).eq('name', name)
+        response = self._match_version(query, expected_version).execute()
+        if not response.data:
+            raise PortfolioConflictError(name)
+
+    def delete(self, name, expected_version):
+        query = self.client.table('portfolios').delete().eq('name', name)
+        response = self._match_version(query, expected_version).execute()
+        if not response.data:
+            raise PortfolioConflictError(name)
+
+    def load_settings(self, prefix):
+        response = self.client.table('control_panel_data').select('key, value').like('key', f'{prefix}%').execute()
+        return {row['key']: row['value'] for row in response.data if row['key'].startswith(prefix)}
+
+    def save_setting(self, key, value):
+        self.client.table('control_panel_data').upsert({'key': key, 'value': value}).execute()
+
+    def delete_setting(self, key):
+        self.client.table('control_panel_data').delete().eq('key', key).execute()
+
+
+class JsonFileBackend:
+    """
+    Yerel JSON dosyası (örn. portfolios.json). Dosya bir liste içerir; elemanlar sütunsal
+    biçimde, {'current', 'history'} yapısında ya da eski düz portföy yapısında olabilir.
+    Dosya tek parça olduğundan her yazmada yeniden yazılır; test ve çevrimdışı kullanım içindir.
+    Kontrol paneli verileri yanındaki '<dosya>.control_panel.json' dosyasında tutulur.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.settings_path = os.path.splitext(path)[0] + '.control_panel.json'
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            rows = json.load(f)
+        portfolios = {}
+        for row in rows:
+            container = normalize_portfolio_row((row.get('current') or row).get('name'), row)
+            name = container and container['current'].get('name')
+            if name:
+                portfolios[name] = container
+        return portfolios
+
+    def load_one(self, name):
+        return self.load_all().get(name)
+
+    def load_metadata(self):
+        return [portfolio_metadata(name, c) for name, c in self.load_all().items()]
+
+    def load_versions(self):
+        return {name: portfolio_version(c) for name, c in self.load_all().items()}
+
+    def _write(self, portfolios):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # Her portföy tek satır: sütunsal dizilerin girintiyle satırlara bölünmesi dosyayı şişirir
+            f.write('[\n' + ',\n'.join(
+                json.dumps(encode_portfolio(c), ensure_ascii=False, separators=(',', ':'))
+                for c in portfolios.values()
+            ) + '\n]\n')
+        os.replace(tmp_path, self.path)
+
+    def _check_version(self, portfolios, name, expected_version):
+        if expected_version is None:
+            if name in portfolios:
+                raise PortfolioConflictError(name)
+        elif name not in portfolios or portfolio_version(portfolios[name]) != expected_version:
+            raise PortfolioConflictError(name)
+
+    def upsert(self, name, container, expected_version):
+        with self._lock:
+            portfolios = self.load_all()
+            self._check_version(portfolios, name, expected_version)
+            portfolios[name] = container
+            self._write(portfolios)
+
+    def delete(self, name, expected_version):
+        with self._lock:
+            portfolios = self.load_all()
+            self._check_version(portfolios, name, expected_version)
+            del portfolios[name]
+            self._write(portfolios)
+
+    def _read_settings(self):
+        if not os.path.exists(self.settings_path):
+            return {}
+        with open(self.settings_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_settings(self, settings):
+        tmp_path = self.settings_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(settings, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.settings_path)
+
+    def load_settings(self, prefix):
+        return {k: v for k, v in self._read_settings().items() if k.startswith(prefix)}
+
+    def save_setting(self, key, value):
+        with self._lock:
+            self._write_settings({**self._read_settings(), key: value})
+
+    def delete_setting(self, key):
+        with self._lock:
+            settings = self._read_settings()
+            if settings.pop(key, None) is not None:
+                self._write_settings(settings)
+
+
+class SqliteBackend:
+    """Yerel SQLite dosyası; Supabase tablosuyla aynı (name, data) şemasını kullanır."""
+
+    VERSION_MATCH = "name = ? AND COALESCE(json_extract(data, '$.version'), 0) = ?"
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS portfolios (name TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS control_panel_data (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load_all(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT name, data FROM portfolios').fetchall()
+        portfolios = {}
+        for name, data in rows:
+            container = normalize_portfolio_row(name, json.loads(data))
+            if container:
+                portfolios[name] = container
+        return portfolios
+
+    def load_one(self, name):
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM portfolios WHERE name = ?', (name,)).fetchone()
+        return normalize_portfolio_row(name, json.loads(row[0])) if row else None
+
+    def load_metadata(self):
+        columns = ', '.join(
+            f"COALESCE(json_extract(data, '$.current.m.{f}'), json_extract(data, '$.current.{f}'), "
+            f"json_extract(data, '$.{f}'))"
+            for f in ('name',) + METADATA_FIELDS
+        )
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT name, {columns} FROM portfolios').fetchall()
+        return [
+            {'name': row[1] or row[0], **dict(zip(METADATA_FIELDS, row[2:]))}
+            for row in rows
+        ]
+
+    def load_versions(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, COALESCE(json_extract(data, '$.version'), 0) FROM portfolios").fetchall()
+        return dict(rows)
+
+    def upsert(self, name, container, expected_version):
+        data = json.dumps(encode_portfolio(container), ensure_ascii=False, separators=(',', ':'))
+        with self._connect() as conn:
+            if expected_version is None:
+                try:
+                    conn.execute('INSERT INTO portfolios (name, data) VALUES (?, ?)', (name, data))
+                except sqlite3.IntegrityError:
+                    raise PortfolioConflictError(name)
+                return
+            cursor = conn.execute(f'UPDATE portfolios SET data = ? WHERE {self.VERSION_MATCH}',
+                                  (data, name, expected_version))
+            if cursor.rowcount == 0:
+                raise PortfolioConflictError(name)
+
+    def delete(self, name, expected_version):
+        with self._connect() as conn:
+            cursor = conn.execute(f'DELETE FROM portfolios WHERE {self.VERSION_MATCH}', (name, expected_version))
+            if cursor.rowcount == 0:
+                raise PortfolioConflictError(name)
+
+    def load_settings(self, prefix):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT key, value FROM control_panel_data WHERE substr(key, 1, ?) = ?',
+                                (len(prefix), prefix)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def save_setting(self, key, value):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO control_panel_data (key, value) VALUES (?, ?)',
+                         (key, json.dumps(value, ensure_ascii=False)))
+
+    def delete_setting(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM control_panel_data WHERE key = ?', (key,))
+
+
+# --- BELLEK İÇİ PORTFÖY DEPOSU ---
+
+class PortfolioRepository:
+    """
+    Portföyleri arka uçtan bir kez yükleyip bellekte isim indeksli olarak tutar.
+    Okumalar sözlük erişimidir; yazmalar önce arka uca, sonra belleğe yansıtılır (write-through).
+    Diğer süreçlerin (ör. gunicorn worker'ları) yazmaları, en fazla revalidate_interval saniyede bir
+    arka uçtan sadece isim/versiyon okunarak fark edilir; değişen kayıtlar tek tek yeniden yüklenir.
+    """
+
+    def __init__(self, backend, revalidate_interval=5.0):
+        self.backend = backend
+        self.revalidate_interval = revalidate_interval
+        self.version = 0                 # Her değişiklikte artar; türetilmiş önbellekler için anahtar
+        self._portfolios = None
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._etags = {}                 # isim -> (kayıt, etag); kayıt nesnesi değişince geçersizdir
+        self._metadata = (None, None)    # (kaynak sözlük, (liste, etag))
+        self._checked_at = 0.0           # Son versiyon kontrolünün zamanı (monotonic)
+        self._seen_versions = {}         # Son kontrolde arka uçta görülen versiyonlar
+
+    def _load(self):
+        if self._portfolios is None:
+            with self._lock:
+                if self._portfolios is None:
+                    with metrics.span('storage.load_all'):
+                        self._portfolios = self.backend.load_all()
+                    self._checked_at = time.monotonic()
+        return self._portfolios
+
+    def _ensure_loaded(self):
+        try:
+            self._load()
+        except Exception as e:
+            # Yükleme başarısızsa boş döner, bir sonraki okumada tekrar denenir
+            print(f"Portföyler yüklenirken hata: {e}")
+            return {}
+        self._revalidate()
+        return self._portfolios
+
+    def _revalidate(self):
+        """
+        Süre dolduysa arka uçtaki versiyonları bellektekilerle karşılaştırır; farklı, yeni ya da
+        silinmiş kayıtları tazeler. Başka bir thread kontrol ediyorsa beklemeden mevcut kopya kullanılır.
+        """
+        if self._portfolios is None or time.monotonic() - self._checked_at < self.revalidate_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._portfolios is None or time.monotonic() - self._checked_at < self.revalidate_interval:
+                return
+            self._checked_at = time.monotonic()
+            with metrics.span('storage.load_versions'):
+                versions = self.backend.load_versions()
+            portfolios = self._portfolios
+            for name in set(versions) | set(portfolios):
+                version = versions.get(name)
+                current = portfolio_version(portfolios[name]) if name in portfolios else None
+                # Bellekte olmayan (geçersiz) satırlar sadece versiyonları değiştiğinde yeniden denenir
+                if version != current and version != self._seen_versions.get(name, current):
+                    self._reload_one(name)
+            self._seen_versions = versions
+        except Exception as e:
+            # Kontrol başarısızsa mevcut kopya kullanılmaya devam edilir
+            print(f"Portföy versiyonları kontrol edilirken hata: {e}")
+        finally:
+            self._lock.release()
+
+    def all(self):
+        """Tüm portföyleri döner. Dönen sözlük paylaşılır, SALT OKUNUR kullanılmalıdır."""
+        return self._ensure_loaded()
+
+    def get(self, name):
+        """Portföyün değiştirilebilir bir kopyasını döner; yoksa None."""
+        container = self._ensure_loaded().get(name)
+        return copy.deepcopy(container) if container is not None else None
+
+    def get_for_update(self, name, expected_version=None):
+        """
+        Üzerine yeni versiyon kurulacak kaydın kopyasını döner; yoksa None.
+        expected_version bellekteki versiyondan farklıysa (kayıt başka bir süreçte değişmiş olabilir)
+        kayıt önce arka uçtan tazelenir; çağıran, dönen kaydın versiyonunu yine de kontrol etmelidir.
+        """
+        with self._lock:
+            container = self._load().get(name)
+            if expected_version is not None and portfolio_version(container) != expected_version:
+                self._reload_one(name)
+                container = self._portfolios.get(name)
+        return copy.deepcopy(container) if container is not None else None
+
+    def names(self):
+        return list(self._ensure_loaded())
+
+    def etag(self, name):
+        """Portföyün içerik özeti; portföy yoksa None."""
+        container = self._ensure_loaded().get(name)
+        if container is None:
+            return None
+        cached = self._etags.get(name)
+        if cached is not None and cached[0] is container:
+            return cached[1]
+        tag = content_etag(container)
+        self._etags[name] = (container, tag)
+        return tag
+
+    def metadata(self):
+        """
+        İsme göre sıralı portföy özet listesini ve listenin ETag'ini döner.
+        Depo henüz yüklenmediyse tüm veriyi çekmek yerine arka ucun hafif özet sorgusu kullanılır.
+        """
+        self._revalidate()
+        portfolios = self._portfolios
+        if portfolios is None:
+            try:
+                with metrics.span('storage.load_metadata'):
+                    rows = self.backend.load_metadata()
+            except Exception as e:
+                print(f"Portföy listesi yüklenirken hata: {e}")
+                rows = []
+            rows.sort(key=lambda p: p['name'])
+            return rows, content_etag(rows)
+
+        source, cached = self._metadata
+        if source is portfolios:
+            return cached
+        rows = sorted((portfolio_metadata(n, c) for n, c in portfolios.items()), key=lambda p: p['name'])
+        cached = (rows, content_etag(rows))
+        self._metadata = (portfolios, cached)
+        return cached
+
+    def save(self, name, container, expected_version=None):
+        """
+        Tek bir portföyü yazar ve yeni versiyon numarasını döner.
+        expected_version verilmezse bellekteki versiyon esas alınır. Kayıt bu arada başka bir
+        istek/süreç tarafından değiştirildiyse PortfolioConflictError fırlatılır.
+        """
+        with self._lock:
+            # Yazmadan önce güncel durum mutlaka yüklenmiş olmalı (yükleme hatası yukarı iletilir)
+            existing = self._load().get(name)
+            if expected_version is None and existing is not None:
+                expected_version = portfolio_version(existing)
+
+            container = copy.deepcopy(container)
+            container['version'] = (expected_version or 0) + 1
+            try:
+                with metrics.span('storage.upsert'):
+                    self.backend.upsert(name, container, expected_version)
+            except PortfolioConflictError:
+                self._reload_one(name)
+                raise
+
+            # Bellekte de arka ucun sakladığı (kodlayıcıdan geçmiş) biçim tutulur; böylece gövde ve
+            # etag, kaydı depodan okuyan diğer worker'larla aynı olur ('12.50' yerine 12.5)
+            self._portfolios = {**self._portfolios, name: decode_portfolio(encode_portfolio(container))}
+            self._changed(name)
+            return container['version']
+
+    def delete(self, name, expected_version=None):
+        """Portföyü siler; bulunamazsa False döner."""
+        with self._lock:
+            existing = self._load().get(name)
+            if existing is None:
+                return False
+            if expected_version is None:
+                expected_version = portfolio_version(existing)
+            try:
+                with metrics.span('storage.delete'):
+                    self.backend.delete(name, expected_version)
+            except PortfolioConflictError:
+                self._reload_one(name)
+                raise
+
+            self._portfolios = {n: c for n, c in self._portfolios.items() if n != name}
+            self._changed(name)
+            return True
+
+    def _reload_one(self, name):
+        """Çakışma sonrası tek kaydı arka uçtan tazeler."""
+        with metrics.span('storage.load_one'):
+            container = self.backend.load_one(name)
+        updated = {n: c for n, c in self._portfolios.items() if n != name}
+        if container is not None:
+            updated[name] = container
+        self._portfolios = updated
+        self._changed(name)
+
+    def invalidate(self):
+        """Bellekteki kopyayı düşürür; bir sonraki okuma arka uçtan yeniden yükler."""
+        with self._lock:
+            self._portfolios = None
+            self._changed(None)
+
+    def on_change(self, callback):
+        """Her değişiklikte callback(isim) çağrılır (tam geçersizleştirmede isim None'dır)."""
+        self._listeners.append(callback)
+
+    def _changed(self, name):
+        self.version += 1
+        if name is None:
+            self._etags.clear()
+        else:
+            self._etags.pop(name, None)
+        for callback in self._listeners:
+            try:
+                callback(name)
+            except Exception as e:
+                print(f"Depo değişiklik bildirimi başarısız: {e}")
@@ -0,0 +1,150 @@
+import json
+
+import pytest
+
+from portfolio_codec import PORTFOLIO_FORMAT, decode_portfolio, encode_portfolio, is_encoded
+from storage import normalize_portfolio_row
+
+
+def roundtrip(container):
+    # Depoya JSON olarak yazıldığı için JSON'dan da geçirilir
+    return decode_portfolio(json.loads(json.dumps(encode_portfolio(container))))
+
+
+CURRENT = {
+    'name': 'Örnek Fon', 'fonTipi': 'Hisse Senedi Yoğun Fon', 'altKategori': 'Katılım', 'yonetim_tipi': None,
+    'stocks': [
+        {'ticker': 'THYAO', 'weight': '12.50', 'adet': '1000'},
+        {'ticker': 'GARAN', 'weight': 7, 'adet': 250, 'borsa_tipi': 'bist'},
+        {'ticker': 'AAPL', 'weight': 2.0, 'adet': '10', 'borsa_tipi': 'yabanci'},
+        {'ticker': 'NAKIT', 'weight': '1e1', 'adet': None},
+        {'ticker': 'TERA', 'weight': 'yok'},
+        {'ticker': 'PGSUS', 'weight': 3, 'not': 'ek alan'},
+    ],
+    'funds': [{'ticker': 'IIP', 'weight': '5.00', 'adet': '1000'}],
+}
+
+# CURRENT'in depodan okunduktan sonraki hali: sütunlara sığan satırlardaki sayısal metinler sayıya
+# çevrilir; None değerli, sayısal olmayan ve ek alanlı satırlar olduğu gibi kalır.
+EXPECTED_CURRENT = {
+    'name': 'Örnek Fon', 'fonTipi': 'Hisse Senedi Yoğun Fon', 'altKategori': 'Katılım', 'yonetim_tipi': None,
+    'stocks': [
+        {'ticker': 'THYAO', 'weight': 12.5, 'adet': 1000},
+        {'ticker': 'GARAN', 'weight': 7, 'adet': 250, 'borsa_tipi': 'bist'},
+        {'ticker': 'AAPL', 'weight': 2.0, 'adet': 10, 'borsa_tipi': 'yabanci'},
+        {'ticker': 'NAKIT', 'weight': '1e1', 'adet': None},
+        {'ticker': 'TERA', 'weight': 'yok'},
+        {'ticker': 'PGSUS', 'weight': 3, 'not': 'ek alan'},
+    ],
+    'funds': [{'ticker': 'IIP', 'weight': 5.0, 'adet': 1000}],
+}
+
+
+def test_legacy_container_roundtrip():
+    container = {
+        'current': CURRENT,
+        'history': [
+            {**CURRENT, 'stocks': CURRENT['stocks'][:2], 'save_timestamp': '2025-01-02 10:00:00'},
+        ],
+    }
+    assert roundtrip(container) == {
+        'current': EXPECTED_CURRENT,
+        'history': [{
+            'name': 'Örnek Fon', 'fonTipi': 'Hisse Senedi Yoğun Fon', 'altKategori': 'Katılım', 'yonetim_tipi': None,
+            'stocks': [
+                {'ticker': 'THYAO', 'weight': 12.5, 'adet': 1000},
+                {'ticker': 'GARAN', 'weight': 7, 'adet': 250, 'borsa_tipi': 'bist'},
+            ],
+            'funds': [{'ticker': 'IIP', 'weight': 5.0, 'adet': 1000}],
+            'save_timestamp': '2025-01-02 10:00:00',
+        }],
+    }
+
+
+def test_flat_legacy_row_roundtrip():
+    row = {'name': 'Düz', 'stocks': [{'ticker': 'SISE', 'weight': '40', 'adet': '5'}]}
+    container = normalize_portfolio_row('Düz', row)
+    assert container == {'current': row, 'history': []}
+    assert roundtrip(container) == {
+        'current': {'name': 'Düz', 'stocks': [{'ticker': 'SISE', 'weight': 40, 'adet': 5}]}, 'history': []
+    }
+
+
+def test_encoded_row_is_stable():
+    container = {'current': CURRENT, 'history': [dict(CURRENT, save_timestamp='2025-01-02 10:00:00')], 'version': 7}
+    encoded = json.loads(json.dumps(encode_portfolio(container)))
+    assert is_encoded(encoded) and encoded['format'] == PORTFOLIO_FORMAT
+    decoded = decode_portfolio(encoded)
+    assert decoded['version'] == 7
+    assert encode_portfolio(decoded) == encoded
+    assert normalize_portfolio_row('Örnek Fon', encoded) == decoded
+
+
+def test_history_deltas():
+    stocks = CURRENT['stocks']
+    history = [
+        # Satırlar yeniden sıralanmış, biri silinmiş, biri değişmiş, biri eklenmiş
+        {**CURRENT, 'stocks': [stocks[1], stocks[0], {'ticker': 'THYAO', 'weight': 11}, stocks[4],
+                               {'ticker': 'BIMAS', 'weight': '4', 'borsa_tipi': 'bist'}],
+         'save_timestamp': '2025-01-03 09:00:00'},
+        # Meta alanları değişmiş ve biri tamamen yok; fon listesi hiç yok
+        {'name': 'Örnek Fon', 'fonTipi': 'Serbest Fon', 'stocks': stocks[3:], 'save_timestamp': '2025-01-02'},
+        # Tekrarlanan satırlar ve boş liste
+        {**CURRENT, 'stocks': [stocks[0], stocks[0]], 'funds': []},
+    ]
+    container = {'current': CURRENT, 'history': history, 'version': 3}
+    decoded = roundtrip(container)
+    assert decoded['current'] == EXPECTED_CURRENT
+    assert decoded['version'] == 3
+    assert decoded['history'] == [
+        {**EXPECTED_CURRENT, 'stocks': [
+            {'ticker': 'GARAN', 'weight': 7, 'adet': 250, 'borsa_tipi': 'bist'},
+            {'ticker': 'THYAO', 'weight': 12.5, 'adet': 1000},
+            {'ticker': 'THYAO', 'weight': 11},
+            {'ticker': 'TERA', 'weight': 'yok'},
+            {'ticker': 'BIMAS', 'weight': 4, 'borsa_tipi': 'bist'},
+        ], 'save_timestamp': '2025-01-03 09:00:00'},
+        {'name': 'Örnek Fon', 'fonTipi': 'Serbest Fon', 'stocks': [
+            {'ticker': 'NAKIT', 'weight': '1e1', 'adet': None},
+            {'ticker': 'TERA', 'weight': 'yok'},
+            {'ticker': 'PGSUS', 'weight': 3, 'not': 'ek alan'},
+        ], 'save_timestamp': '2025-01-02'},
+        {**EXPECTED_CURRENT, 'stocks': [
+            {'ticker': 'THYAO', 'weight': 12.5, 'adet': 1000},
+            {'ticker': 'THYAO', 'weight': 12.5, 'adet': 1000},
+        ], 'funds': []},
+    ]
+
+    # Güncel versiyonla aynı satırlar yeniden yazılmaz, aralık olarak başvurulur
+    encoded = encode_portfolio({'current': CURRENT, 'history': [CURRENT]})
+    assert encoded['history'][0]['stocks'] == [[0, len(stocks)]]
+    assert encoded['history'][0]['m'] == {} and encoded['history'][0]['d'] == []
+
+
+def test_decoded_history_is_independent_of_current():
+    decoded = roundtrip({'current': CURRENT, 'history': [CURRENT]})
+    decoded['history'][0]['stocks'][1]['weight'] = 99
+    assert decoded['current']['stocks'][1]['weight'] == 7
+
+
+def test_numeric_normalisation():
+    container = {'current': {'name': 'N', 'stocks': [
+        {'ticker': 'A', 'weight': '12.50', 'adet': '1e2'},
+        {'ticker': 'B', 'weight': '3', 'adet': None},
+        {'ticker': 'C', 'weight': 'nan'},
+    ]}, 'history': []}
+    stocks = roundtrip(container)['current']['stocks']
+    assert stocks[0] == {'ticker': 'A', 'weight': 12.5, 'adet': 100.0}
+    # Açıkça None verilen alanlar ve sayıya çevrilemeyen değerler olduğu gibi korunur
+    assert stocks[1] == {'ticker': 'B', 'weight': '3', 'adet': None}
+    assert stocks[2] == {'ticker': 'C', 'weight': 'nan'}
+
+
+def test_missing_asset_lists_stay_absent():
+    container = {'current': {'name': 'Boş', 'stocks': []}, 'history': [{'name': 'Boş'}]}
+    assert roundtrip(container) == container
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        decode_portfolio({'format': 99})
@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class UpstreamTimeoutError(Exception):
+    """Upstream çağrıları toplam süre sınırı içinde tamamlanamadı."""
+
+
+class EmptyUpstreamResponse(Exception):
+    """Upstream boş yanıt döndü (yfinance hataları çoğu zaman istisna yerine boş tablo olarak döner)."""
+
+
+class UpstreamExecutor:
+    """
+    Upstream (Yahoo vb.) çağrıları için paylaşılan, sınırlı bir thread havuzu.
+    Host başına eşzamanlı çağrı sınırı, çağrı başına zaman aşımı ve
+    rastgele (jitter) bekleme süreli yeniden deneme uygular.
+    """
+
+    def __init__(self, max_workers, per_host_limit, timeout, retries, backoff):
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upstream')
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slots(self, host):
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def call(self, host, fn, *args):
+        """
+        fn(*args)'ı host sınırı içinde çalıştırır; hata alırsa artan ve rastgeleleştirilmiş aralıklarla tekrar dener.
+        EmptyUpstreamResponse yeniden denenmez: istisnasız dönen boş yanıt çoğu zaman sembolün upstream'de
+        bulunmamasından kaynaklanır ve tekrar denemek sonucu değiştirmez.
+        """
+        for attempt in range(self.retries + 1):
+            with self._slots(host):
+                try:
+                    return fn(*args)
+                except EmptyUpstreamResponse:
+                    raise
+                except Exception as e:
+                    error = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        raise error
+
+    def map(self, host, fn, arg_list):
+        """
+        fn'i her argüman demeti için havuzda eşzamanlı çalıştırır ve sonuçları aynı sırayla döner.
+        Başarısız çağrıların yerinde istisna nesnesi bulunur. Toplam bekleme, tek bir çağrının
+        tüm denemeleri için gereken süreyle sınırlıdır; aşılırsa UpstreamTimeoutError fırlatılır.
+        """
+        futures = [self._pool.submit(self.call, host, fn, *args) for args in arg_list]
+        deadline = (self.timeout + self.backoff * (2 ** self.retries) * 1.5) * (self.retries + 1)
+        # Sıradaki çağrılar slot beklerken geçen süre de hesaba katılır
+        deadline *= max(1, -(-len(arg_list) // self.per_host_limit))
+        done, not_done = wait(futures, timeout=deadline)
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            raise UpstreamTimeoutError(f'{len(not_done)} upstream çağrısı {deadline:.0f} sn içinde tamamlanamadı')
+        return [f.exception() or f.result() for f in futures]
+
+
+class CircuitOpenError(Exception):
+    """Devre kesici açık: upstream art arda başarısız olduğu için çağrı yapılmadı."""
+
+
+class CircuitBreaker:
+    """
+    Art arda 'failure_threshold' upstream hatasından sonra devreyi açar; açıkken çağrılar
+    beklemeden CircuitOpenError ile reddedilir ve istekler zaman aşımı maliyeti ödemez.
+    Açık devrede arka plan thread'i her 'reset_timeout' saniyede bir probe() çağırır;
+    başarılı olursa devre kapanır.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout, probe):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._closed.set()
+
+    @property
+    def is_open(self):
+        return not self._closed.is_set()
+
+    def call(self, fn, *args, is_failure=None):
+        """
+        fn(*args)'ı devre kapalıysa çalıştırır ve sonucu devre durumuna işler.
+        is_failure(sonuç) True dönerse çağrı istisnasız tamamlansa da hata sayılır; sonuç yine döner.
+        """
+        if self.is_open:
+            raise CircuitOpenError(f'{self.name}: upstream geçici olarak devre dışı')
+        try:
+            result = fn(*args)
+        except Exception:
+            self.record_failure()
+            raise
+        if is_failure is not None and is_failure(result):
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold or self.is_open:
+                return
+            self.opened_at = time.time()
+            self._closed.clear()
+        print(f"Devre kesici açıldı ({self.name}): art arda {self.failures} upstream hatası")
+        threading.Thread(target=self._probe_loop, name=f'{self.name}-probe', daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._closed.set()
+
+    def _probe_loop(self):
+        while self.is_open:
+            time.sleep(self.reset_timeout)
+            try:
+                self.probe()
+            except Exception as e:
+                print(f"Devre kesici denemesi başarısız ({self.name}): {e}")
+                continue
+            self.close()
+            print(f"Devre kesici kapandı ({self.name}): upstream yeniden erişilebilir")
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import metrics
+
+
+DEFAULT_WATCHLIST = 'default'
+# Varsayılan liste, kontrol panelinin kullandığı eski 'tracked_funds' anahtarında kalır;
+# isimli listeler 'tracked_funds:<isim>' anahtarlarında tutulur.
+WATCHLIST_KEY = 'tracked_funds'
+
+
+def watchlist_key(name):
+    return WATCHLIST_KEY if name == DEFAULT_WATCHLIST else f'{WATCHLIST_KEY}:{name}'
+
+
+def normalize_funds(funds):
+    """Fon adları listesini temizler (boşluklar kırpılır, boş ve tekrar edenler atılır); geçersizse None."""
+    if not isinstance(funds, list) or not all(isinstance(f, str) for f in funds):
+        return None
+    return list(dict.fromkeys(f.strip() for f in funds if f.strip()))
+
+
+class WatchlistRepository:
+    """
+    Takip listeleri (isim -> fon adları). Arka ucun kontrol paneli verilerinden okunur ve en fazla
+    revalidate_interval saniye bellekte tutulur; böylece diğer süreçlerin (gunicorn worker'ları)
+    yazmaları bu süre içinde görünür. Yazmalar önce arka uca, sonra belleğe yansıtılır.
+    """
+
+    def __init__(self, backend, revalidate_interval=5.0):
+        self.backend = backend
+        self.revalidate_interval = revalidate_interval
+        self._watchlists = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _expired(self):
+        return self._watchlists is None or time.monotonic() - self._loaded_at >= self.revalidate_interval
+
+    def _load(self):
+        if self._expired():
+            with self._lock:
+                if self._expired():
+                    try:
+                        with metrics.span('storage.load_settings'):
+                            rows = self.backend.load_settings(WATCHLIST_KEY)
+                    except Exception as e:
+                        # Daha önce yüklenmiş listeler varsa onlarla devam edilir
+                        if self._watchlists is None:
+                            raise
+                        print(f"Takip listeleri tazelenirken hata: {e}")
+                        rows = None
+                    if rows is not None:
+                        watchlists = {}
+                        for key, funds in rows.items():
+                            if key == WATCHLIST_KEY:
+                                watchlists[DEFAULT_WATCHLIST] = normalize_funds(funds) or []
+                            elif key.startswith(WATCHLIST_KEY + ':'):
+                                watchlists[key[len(WATCHLIST_KEY) + 1:]] = normalize_funds(funds) or []
+                        self._watchlists = watchlists
+                    self._loaded_at = time.monotonic()
+        return self._watchlists
+
+    def all(self):
+        """{isim: fon listesi}. Dönen sözlük paylaşılır, SALT OKUNUR kullanılmalıdır."""
+        return self._load()
+
+    def get(self, name):
+        """Listenin fonları; liste yoksa None (varsayılan liste her zaman vardır)."""
+        funds = self._load().get(name)
+        if funds is None and name == DEFAULT_WATCHLIST:
+            return []
+        return funds
+
+    def save(self, name, funds):
+        funds = normalize_funds(funds)
+        if funds is None:
+            raise ValueError('Fon listesi metinlerden oluşan bir liste olmalıdır.')
+        self._load()
+        with self._lock:
+            with metrics.span('storage.save_setting'):
+                self.backend.save_setting(watchlist_key(name), funds)
+            self._watchlists = {**self._watchlists, name: funds}
+        return funds
+
+    def delete(self, name):
+        """Listeyi siler; bulunamazsa False döner."""
+        if name not in self._load():
+            return False
+        with self._lock:
+            with metrics.span('storage.delete_setting'):
+                self.backend.delete_setting(watchlist_key(name))
+            self._watchlists = {n: f for n, f in self._watchlists.items() if n != name}
+        return True